@@ -1,11 +1,11 @@
+import hashlib
+import hmac
 import os
-import random
+import threading
+import time
 
-import sys
-import traceback
-
-from flask import Flask
-from flask_httpauth import HTTPBasicAuth
+from flask import Flask, g
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
 from flask_migrate import Migrate
 from flask_bootstrap import Bootstrap
 from flask.globals import request
@@ -14,16 +14,24 @@ from flask.json import jsonify
 from flask.templating import render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import FlaskForm
-from werkzeug.exceptions import BadRequest
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.exceptions import BadRequest, ServiceUnavailable
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import redirect
 from wtforms.fields.core import StringField
 from wtforms.fields.simple import PasswordField, SubmitField
 from wtforms.validators import InputRequired, Length, Email, ValidationError
 
-from utils.fingering_rules import predict_fingering
-from utils.identify import identify, idntf
-from utils.utilities import greene_table
+from utils.analysis import ShapeAnalysis
+from utils.answer_table import load_answer_table
+from utils.caching import TTLCache
+from utils.fingering_pool import FingeringUnavailable, load_fingering_pool
+from utils.fingering_rules import predict_fingering, predict_fingerings
+from utils.progression import (fingering_progression,
+                               DEFAULT_ALTERNATIVES as PROGRESSION_ALTERNATIVES)
+from utils.result_cache import load_result_cache
+from utils.shapes import parse_frets, format_frets
+from utils.voicings import VoicingIndex
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -34,11 +42,55 @@ app.config['SECRET_KEY'] = os.environ.get(
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
     'SQLALCHEMY_DATABASE_URI')
 app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN'] = True
+app.config['ANSWER_TABLE'] = os.environ.get(
+    'ANSWER_TABLE', os.path.join(basedir, 'answers.bin'))
+app.config['MAX_BATCH_SHAPES'] = int(os.environ.get(
+    'MAX_BATCH_SHAPES', 1000))
+app.config['RESULT_CACHE'] = os.environ.get(
+    'RESULT_CACHE', os.path.join(basedir, 'results.sqlite'))
+app.config['RESULT_CACHE_SIZE'] = int(os.environ.get(
+    'RESULT_CACHE_SIZE', 100000))
+app.config['FINGERING_PROCESSES'] = int(os.environ.get('FINGERING_PROCESSES', 0))
+app.config['FINGERING_QUEUE_SIZE'] = int(os.environ.get('FINGERING_QUEUE_SIZE', 32))
+app.config['FINGERING_TIMEOUT'] = float(os.environ.get('FINGERING_TIMEOUT', 2))
+app.config['AUTH_CACHE_TTL'] = int(os.environ.get('AUTH_CACHE_TTL', 300))
+app.config['AUTH_CACHE_SIZE'] = int(os.environ.get('AUTH_CACHE_SIZE', 1024))
+app.config['TOKEN_EXPIRATION'] = int(os.environ.get('TOKEN_EXPIRATION', 3600))
 
 bootstrap = Bootstrap(app)
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
-auth = HTTPBasicAuth()
+basic_auth = HTTPBasicAuth()
+token_auth = HTTPTokenAuth(scheme='Bearer')
+auth = MultiAuth(basic_auth, token_auth)
+# verified credentials: email -> (credentials digest, user id)
+credentials_cache = TTLCache(maxsize=app.config['AUTH_CACHE_SIZE'],
+                             ttl=app.config['AUTH_CACHE_TTL'])
+# precomputed answers (built with `python -m utils.answer_table`), if any
+answer_table = load_answer_table(app.config['ANSWER_TABLE'])
+# results of the shapes missing from the table, shared by the workers
+result_cache = load_result_cache(app.config['RESULT_CACHE'],
+                                 app.config['RESULT_CACHE_SIZE'])
+# worker processes searching the fingerings, if enabled
+fingering_pool = load_fingering_pool(app.config['FINGERING_PROCESSES'],
+                                     app.config['FINGERING_QUEUE_SIZE'],
+                                     app.config['FINGERING_TIMEOUT'])
+# chord names to voicings index of the answer table, built on first use
+voicing_index = None
+voicing_index_lock = threading.Lock()
+
+# highest fret of the input shapes
+MAX_INPUT_FRET = 24
+# maximum number of voicings returned by a request
+MAX_VOICINGS = 100
+# maximum number of alternative fingerings returned for a shape
+MAX_ALTERNATIVES = 10
+# number of alternative fingerings of the alternatives field
+DEFAULT_ALTERNATIVES = 3
+# output fields stored in the result cache
+CACHED_FIELDS = ('chord_names', 'fingers', 'cost')
+# output fields given by the fingering search
+FINGERING_FIELDS = ('fingers', 'cost')
 
 
 class User(db.Model):
@@ -55,6 +107,8 @@ class User(db.Model):
     @password.setter
     def password(self, password):
         self.password_hash = generate_password_hash(password, salt_length=12)
+        # the old password must not be accepted from the cache anymore
+        credentials_cache.discard(self.email)
 
     def verify_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -92,13 +146,78 @@ def success():
     return render_template('success.html')
 
 
-@auth.verify_password
+@basic_auth.verify_password
 def verify_password(email, password):
-    if email and password:
-        user = User.query.filter_by(email=email).first()
-    if not user:
+    if not email or not password:
+        return False
+    user_id = check_credentials(email, password)
+    if user_id is None:
+        return False
+    g.user_id = user_id
+    return True
+
+
+def cached_credentials(email, password):
+    """ Returns the user id of credentials verified recently, None otherwise """
+    cached = credentials_cache.get(email)
+    if cached is not None and hmac.compare_digest(cached[0], credentials_digest(email, password)):
+        return cached[1]
+    return None
+
+
+def check_credentials(email, password):
+    """ Returns the user id of valid credentials, None otherwise """
+    user_id = cached_credentials(email, password)
+    if user_id is not None:
+        return user_id
+    user = User.query.filter_by(email=email).first()
+    if not user or not user.verify_password(password):
+        return None
+    credentials_cache.put(email, (credentials_digest(email, password), user.id))
+    return user.id
+
+
+@token_auth.verify_token
+def verify_token(token):
+    user_id = verify_auth_token(token)
+    if user_id is None:
         return False
-    return user.verify_password(password)
+    g.user_id = user_id
+    return True
+
+
+def credentials_digest(email, password):
+    """ Keyed digest of credentials, so that passwords are not kept in memory """
+    key = (app.config['SECRET_KEY'] or '').encode('utf-8')
+    message = ('%s:%s' % (email, password)).encode('utf-8')
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+def token_serializer():
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='auth-token')
+
+
+def generate_auth_token(user_id):
+    """ Returns a signed token identifying the user """
+    return token_serializer().dumps({'id': user_id})
+
+
+def verify_auth_token(token):
+    """ Returns the user id of a valid token, None otherwise """
+    try:
+        data = token_serializer().loads(
+            token, max_age=app.config['TOKEN_EXPIRATION'])
+    except BadSignature:
+        return None
+    return data.get('id') if isinstance(data, dict) else None
+
+
+# api method for exchanging credentials for a token
+@app.route('/api/v1/token', methods=['POST'])
+@basic_auth.login_required
+def token():
+    return jsonify({'token': generate_auth_token(g.user_id),
+                    'expiration': app.config['TOKEN_EXPIRATION']})
 
 
 # basic api method for getting frets
@@ -109,99 +228,282 @@ def frets():
     data = request.json
     # validate it
     validate_frets_input(data)
+    validate_fields(data)
+    validate_max_ms(data)
+    validate_alternatives(data)
     # create the output
-    output = calculate_output(data['frets'])
+    output = calculate_output(data['frets'], data.get('fields'), data.get('max_ms'),
+                              data.get('alternatives'))
     return output
 
 
+# api method for getting frets of many shapes at once
+@app.route('/api/v1/frets/batch', methods=['POST'])
+@auth.login_required
+def frets_batch():
+    # get the data
+    data = request.json
+    # validate it
+    validate_batch_input(data)
+    validate_fields(data)
+    validate_max_ms(data)
+    validate_alternatives(data)
+    fields = data.get('fields')
+    max_ms = data.get('max_ms')
+    alternatives = data.get('alternatives')
+    # create the output of each distinct shape once, in input order
+    outputs = dict()
+    results = list()
+    for _frets in data['frets']:
+        try:
+            validate_frets(_frets)
+        except BadRequest as e:
+            results.append({'error': e.description})
+            continue
+        shape = parse_frets(_frets)
+        if shape not in outputs:
+            try:
+                outputs[shape] = build_output(shape, fields, max_ms, alternatives)
+            except ServiceUnavailable as e:
+                outputs[shape] = {'error': e.description}
+        results.append(outputs[shape])
+    return jsonify({'results': results})
+
+
+# api method for finding the easiest voicings of a chord
+@app.route('/api/v1/voicings/', methods=['POST'])
+@auth.login_required
+def voicings():
+    # get the data
+    data = request.json
+    # validate it
+    validate_voicings_input(data)
+    index = _get_voicing_index()
+    if index is None:
+        raise ServiceUnavailable('Voicings are not available: no answer table.')
+    # create the output
+    found = index.find(data['chord_name'], k=data.get('k', 10),
+                       fret_min=data.get('fret_min', 0),
+                       fret_max=data.get('fret_max', 24))
+    output = dict()
+    output['voicings'] = [{'frets': format_frets(frets), 'fingers': fingers,
+                           'cost': cost} for frets, fingers, cost in found]
+    return jsonify(output)
+
+
+# api method for fingering a chord progression
+@app.route('/api/v1/progression/', methods=['POST'])
+@auth.login_required
+def progression():
+    # get the data
+    data = request.json
+    # validate it
+    validate_batch_input(data)
+    for _frets in data['frets']:
+        validate_frets(_frets)
+    validate_alternatives(data)
+    # create the output
+    predict = fingering_pool.predict_fingerings if fingering_pool is not None else predict_fingerings
+    try:
+        fingerings, cost, costs, transition_costs = fingering_progression(
+            data['frets'], data.get('alternatives', PROGRESSION_ALTERNATIVES),
+            predict=predict, return_costs=True)
+    except FingeringUnavailable as e:
+        app.logger.warning("Progression not fingered: %s", e)
+        raise ServiceUnavailable('Fingering search is busy, retry later.')
+    output = dict()
+    output['fingers'] = fingerings
+    output['costs'] = costs
+    output['transition_costs'] = transition_costs
+    output['cost'] = cost
+    return jsonify(output)
+
+
 def validate_frets_input(data):
     """ Validates that input contains frets as an 6-integers array"""
     if data and 'frets' in data:
-        _frets = data['frets']
-        # check that frets values are packed into array
-        if not type(_frets) == list:
-            raise BadRequest(
-                'Invalid frets. You should provide a 6-elements array')
-        # must be 6 values (integers)
-        if len(_frets) != 6:
-            raise BadRequest('Invalid frets. You should provide 6 values')
-        for f in _frets:
-            try:
-                int(f)
-            except ValueError:
-                if f.lower() != 'x':
-                    raise BadRequest(
-                        'Inputted frets must be integers or "x" letter')
+        validate_frets(data['frets'])
     else:
         raise BadRequest('Input data is invalid. No frets provided.')
 
 
-def calculate_output(data):
-    """ Function for creating an output for each request. """
+def validate_frets(_frets):
+    """ Validates that frets are an 6-integers array"""
+    # check that frets values are packed into array
+    if not type(_frets) == list:
+        raise BadRequest(
+            'Invalid frets. You should provide a 6-elements array')
+    # must be 6 values (integers)
+    if len(_frets) != 6:
+        raise BadRequest('Invalid frets. You should provide 6 values')
+    for f in _frets:
+        # integers (or their decimal strings, as in the outputs) or 'x'
+        if isinstance(f, str) and f.lower() == 'x':
+            continue
+        if isinstance(f, str) and f.isdecimal():
+            f = int(f)
+        if type(f) != int:
+            raise BadRequest(
+                'Inputted frets must be integers or "x" letter')
+        if not 0 <= f <= MAX_INPUT_FRET:
+            raise BadRequest('Invalid fret %d. Frets must be between 0 and %d'
+                             % (f, MAX_INPUT_FRET))
 
-    # adjust input data in order to use in logic code (must be strings)
-    data = ["{}".format(d) for d in data]
 
-    output = dict()
-    output['chord_names'] = _get_chord_names(data)
-    output['fingers'] = _get_fingers(data)
-    output['greene_voicing'] = _get_greene_voicing(data)
-    return jsonify(output)
+def validate_batch_input(data):
+    """ Validates that input contains a list of frets arrays"""
+    if not data or 'frets' not in data:
+        raise BadRequest('Input data is invalid. No frets provided.')
+    if not type(data['frets']) == list:
+        raise BadRequest(
+            'Invalid frets. You should provide a list of 6-elements arrays')
+    if len(data['frets']) > app.config['MAX_BATCH_SHAPES']:
+        raise BadRequest('Too many frets. You can provide up to %d arrays'
+                         % app.config['MAX_BATCH_SHAPES'])
+
+
+def validate_fields(data):
+    """ Validates that the optional fields are a list of output fields"""
+    if 'fields' not in data:
+        return
+    fields = data['fields']
+    if not type(fields) == list or not fields:
+        raise BadRequest('Invalid fields. You should provide a non-empty array')
+    for field in fields:
+        if field not in ShapeAnalysis.stages:
+            raise BadRequest('Invalid field %r. You should choose among %s'
+                             % (field, ', '.join(ShapeAnalysis.stages)))
+
+
+def validate_max_ms(data):
+    """ Validates that the optional search time limit is a positive number"""
+    if 'max_ms' not in data:
+        return
+    max_ms = data['max_ms']
+    if type(max_ms) not in (int, float) or not max_ms > 0:
+        raise BadRequest('Invalid max_ms. You should provide a positive number '
+                         'of milliseconds')
+
+
+def validate_alternatives(data):
+    """ Validates that the optional number of alternative fingerings is valid"""
+    if 'alternatives' not in data:
+        return
+    alternatives = data['alternatives']
+    if type(alternatives) != int or not 1 <= alternatives <= MAX_ALTERNATIVES:
+        raise BadRequest('Invalid alternatives. You should provide an integer between 1 and %d'
+                         % MAX_ALTERNATIVES)
+
+
+def validate_voicings_input(data):
+    """ Validates that input contains a chord name and a valid fret window"""
+    if not data or 'chord_name' not in data:
+        raise BadRequest('Input data is invalid. No chord name provided.')
+    if not isinstance(data['chord_name'], str):
+        raise BadRequest('Invalid chord name. You should provide a string')
+    for key in ('fret_min', 'fret_max'):
+        if key in data and (type(data[key]) != int or not 0 <= data[key] <= 24):
+            raise BadRequest('Invalid %s. You should provide a fret between 0 and 24' % key)
+    if data.get('fret_min', 0) > data.get('fret_max', 24):
+        raise BadRequest('Invalid fret window. fret_min is above fret_max')
+    if 'k' in data and (type(data['k']) != int or not 1 <= data['k'] <= MAX_VOICINGS):
+        raise BadRequest('Invalid k. You should provide an integer between 1 and %d'
+                         % MAX_VOICINGS)
+
+
+def calculate_output(data, fields=None, max_ms=None, alternatives=None):
+    """ Function for creating an output for each request. """
+
+    # adjust input data in order to use in logic code (integer shape)
+    data = parse_frets(data)
+    return jsonify(build_output(data, fields, max_ms, alternatives))
 
 
-def _get_chord_names(data):
+def build_output(data, fields=None, max_ms=None, alternatives=None):
     """
-    Returns chord names for specified frets
+    Returns the output of a shape as a dictionary, with only the given
+    fields (the default stages of ShapeAnalysis if None), searching the
+    fingering for max_ms milliseconds at most if given, and with the given
+    number of alternative fingerings if any.
     """
 
-    try:
-        played_notes = idntf.noteForStrings(data)
-        names = identify(played_notes, idntf)
-    except Exception:
-        _handle_exception()
-        return None
-    return names or None
+    fields = output_fields(fields, alternatives)
+    analysis = start_analysis(data, max_ms, alternatives)
+    analysis.run(fields)
+    return analysis_output(analysis, fields)
+
+
+def output_fields(fields=None, alternatives=None):
+    """ Returns the requested fields, with the alternatives if requested apart """
+    if alternatives is None or (fields and 'alternatives' in fields):
+        return fields
+    return list(fields or ShapeAnalysis.default_stages) + ['alternatives']
 
 
-def _get_fingers(data):
+def start_analysis(data, max_ms=None, alternatives=None):
     """
-    Returns fingers for specified frets
+    Returns the analysis of a shape, with the results already known from
+    the answer table or the result cache, a deadline of max_ms milliseconds
+    from now for the fingering search if given, and the number of
+    alternative fingerings to search if given.
     """
 
-    try:
-        fingers, _ = predict_fingering(data)
-    except Exception:
-        _handle_exception()
-        return None
-    return fingers or None
+    answer = answer_table.lookup(data) if answer_table is not None else None
+    if answer is not None:
+        chord_names, fingers, cost = answer
+        known = {'chord_names': chord_names or None, 'fingers': fingers or None,
+                 'cost': cost}
+    elif result_cache is not None:
+        known = result_cache.get(data) or {}
+    else:
+        known = {}
+    if fingering_pool is not None:
+        predict, predict_alternatives = (fingering_pool.predict_fingering,
+                                         fingering_pool.predict_fingerings)
+    else:
+        predict, predict_alternatives = predict_fingering, predict_fingerings
+    deadline = time.monotonic() + max_ms / 1000. if max_ms is not None else None
+    return ShapeAnalysis(data, known, predict, deadline, predict_alternatives,
+                         alternatives or DEFAULT_ALTERNATIVES)
 
 
-def _get_greene_voicing(data):
+def analysis_output(analysis, fields=None):
     """
-    Returns green voicing data if only there are 4 items in the
-    chord list ofr specified frets.
+    Returns the output of an analysis which has run, with only the given
+    fields (and whether the fingering search completed if it had a deadline),
+    and keeps its new results in the result cache.
     """
 
-    try:
-        played_notes = idntf.noteForStrings(data)
-        result = random.choice(list(greene_table.keys())) if len(
-            played_notes) == 4 else None
-    except Exception:
-        _handle_exception()
-        return None
-    return result
+    results = analysis.results
+    app.logger.debug("Shape %s analysed: %r", analysis.frets, analysis.timings)
+    unavailable = [e for e in analysis.errors.values() if isinstance(e, FingeringUnavailable)]
+    if unavailable:
+        app.logger.warning("Shape %s not analysed: %s", analysis.frets, unavailable[0])
+        raise ServiceUnavailable('Fingering search is busy, retry later.')
+    # the fingering found by an incomplete search may not be the best one
+    cached_fields = [field for field in CACHED_FIELDS if field in results and (
+        analysis.search_complete or field in analysis.provided or field not in FINGERING_FIELDS)]
+    if result_cache is not None and not analysis.provided.issuperset(cached_fields):
+        result_cache.put(analysis.frets, {field: results[field] for field in cached_fields})
+    output = {field: results[field] for field in fields or ShapeAnalysis.default_stages}
+    if analysis.deadline is not None:
+        output['search_complete'] = analysis.search_complete
+    return output
 
 
-def _handle_exception():
+def _get_voicing_index():
     """
-    Prints the traceback of the latest exception.
-    Used in cases where logic code fails
+    Returns the voicing index of the answer table (None without table),
+    building it on first use.
     """
 
-    exc_type, exc_value, exc_traceback = sys.exc_info()
-    traceback.print_tb(exc_traceback, limit=1, file=sys.stdout)
-    traceback.print_exception(exc_type, exc_value, exc_traceback,
-                              limit=2, file=sys.stdout)
+    global voicing_index
+    if answer_table is None:
+        return None
+    with voicing_index_lock:
+        if voicing_index is None:
+            voicing_index = VoicingIndex(answer_table)
+    return voicing_index
 
 
 if __name__ == '__main__':
@@ -0,0 +1,166 @@
+# ASGI variant of the frets API (`/api/v1/frets/` only), served by any
+# ASGI server, e.g. `uvicorn frets_asgi:app`. The event loop never blocks:
+# the database, the result cache and the analysis stages run in a pool of
+# threads, the fingering stages concurrently with the other ones.
+import asyncio
+import base64
+import binascii
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import (HTTPException, BadRequest, MethodNotAllowed,
+                                 NotFound, RequestEntityTooLarge, Unauthorized)
+
+import frets
+from utils.analysis import ShapeAnalysis
+from utils.shapes import parse_frets
+
+frets.app.config['ASGI_THREADS'] = int(os.environ.get('ASGI_THREADS', 8))
+frets.app.config['ASGI_MAX_BODY_SIZE'] = int(os.environ.get(
+    'ASGI_MAX_BODY_SIZE', 65536))
+
+# threads running the blocking work of the requests
+executor = ThreadPoolExecutor(frets.app.config['ASGI_THREADS'])
+
+# stages running the fingering search, run apart from the other ones
+FINGERING_STAGES = ('alternatives', 'fingers', 'cost', 'rule_breakdown')
+
+
+class ClientDisconnected(Exception):
+    """ Raised when the client leaves before sending the whole request. """
+
+
+async def app(scope, receive, send):
+    """ ASGI application """
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    try:
+        if scope['path'] != '/api/v1/frets/':
+            raise NotFound()
+        if scope['method'] != 'POST':
+            raise MethodNotAllowed(['POST'])
+        # authenticate the user
+        headers = dict(scope['headers'])
+        if await authenticate(headers.get(b'authorization')) is None:
+            raise Unauthorized('Unauthorized Access')
+        # get the data
+        data = await read_json(receive)
+        # validate it
+        if not isinstance(data, dict):
+            raise BadRequest('Input data is invalid. No frets provided.')
+        frets.validate_frets_input(data)
+        frets.validate_fields(data)
+        frets.validate_max_ms(data)
+        frets.validate_alternatives(data)
+        # create the output
+        output = await calculate_output(data['frets'], data.get('fields'), data.get('max_ms'),
+                                        data.get('alternatives'))
+    except ClientDisconnected:
+        return
+    except HTTPException as e:
+        headers = []
+        if e.code == 401:
+            headers.append((b'www-authenticate', b'Basic realm="Authentication Required"'))
+        elif e.code == 405:
+            headers.append((b'allow', b'POST'))
+        await send_json(send, e.code, {'error': e.description}, headers)
+        return
+    await send_json(send, 200, output)
+
+
+async def lifespan(receive, send):
+    """ Handles the startup and shutdown of the server """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            if frets.fingering_pool is not None:
+                frets.fingering_pool.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def authenticate(authorization):
+    """
+    Returns the user id of the Basic or Bearer credentials of the
+    Authorization header, None if they are missing or invalid.
+    """
+
+    if not authorization:
+        return None
+    scheme, _, credentials = authorization.decode('latin-1').partition(' ')
+    if scheme.lower() == 'bearer':
+        return frets.verify_auth_token(credentials.strip())
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        credentials = base64.b64decode(credentials.strip()).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    email, _, password = credentials.partition(':')
+    if not email or not password:
+        return None
+    # credentials verified recently do not need the database
+    user_id = frets.cached_credentials(email, password)
+    if user_id is None:
+        user_id = await run_blocking(_check_credentials, email, password)
+    return user_id
+
+
+def _check_credentials(email, password):
+    with frets.app.app_context():
+        return frets.check_credentials(email, password)
+
+
+async def calculate_output(fret_positions, fields=None, max_ms=None, alternatives=None):
+    """ Creates the output of a shape, running its stages concurrently. """
+
+    # adjust input data in order to use in logic code (integer shape)
+    data = parse_frets(fret_positions)
+    fields = frets.output_fields(fields, alternatives)
+    analysis = await run_blocking(frets.start_analysis, data, max_ms, alternatives)
+    stages = fields or ShapeAnalysis.default_stages
+    groups = ([stage for stage in stages if stage in FINGERING_STAGES],
+              [stage for stage in stages if stage not in FINGERING_STAGES])
+    await asyncio.gather(*[run_blocking(analysis.run, group) for group in groups if group])
+    return await run_blocking(frets.analysis_output, analysis, fields)
+
+
+async def read_json(receive):
+    """ Returns the JSON body of the request """
+    body = bytearray()
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        body += message.get('body', b'')
+        if len(body) > frets.app.config['ASGI_MAX_BODY_SIZE']:
+            raise RequestEntityTooLarge()
+        more_body = message.get('more_body', False)
+    try:
+        return json.loads(body.decode('utf-8'))
+    except ValueError:
+        raise BadRequest('Failed to decode JSON object')
+
+
+async def send_json(send, status, output, headers=()):
+    """ Sends a JSON response """
+    body = json.dumps(output, sort_keys=True).encode('utf-8')
+    await send({'type': 'http.response.start',
+                'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode('latin-1'))]
+                + list(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def run_blocking(function, *args):
+    """ Runs a blocking function in the executor, returns its future """
+    return asyncio.get_running_loop().run_in_executor(executor, function, *args)
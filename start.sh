@@ -1,7 +1,7 @@
 # initializing and activating virtualenv
 mkdir -p .venv
 cd .venv
-virtualenv --python=python3.5 frets
+virtualenv --python=python3.11 frets
 cd ..
 source .venv/frets/bin/activate
 
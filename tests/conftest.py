@@ -0,0 +1,32 @@
+import os
+import sys
+
+# the app is configured from the environment when frets is imported: an
+# in-memory database, no answer table, and a result cache of the tests only
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+os.environ['SECRET_KEY'] = 'tests'
+os.environ['ANSWER_TABLE'] = ''
+os.environ['RESULT_CACHE'] = ''
+os.environ['FINGERING_PROCESSES'] = '0'
+
+import pytest  # noqa: E402
+
+import frets  # noqa: E402  (configured by the environment above)
+
+
+@pytest.fixture(scope='module')
+def client():
+    """ Test client of the app, authenticated with the token of a test user """
+    with frets.app.app_context():
+        frets.db.create_all()
+        user = frets.User.query.filter_by(email='test@example.com').first()
+        if user is None:
+            user = frets.User(email='test@example.com', password='123456')
+            frets.db.session.add(user)
+            frets.db.session.commit()
+        token = frets.generate_auth_token(user.id)
+    client = frets.app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + token
+    return client
@@ -0,0 +1,31 @@
+import pytest
+
+from utils.answer_table import build_answer_table, compute_answer, load_answer_table
+from utils.shapes import parse_frets
+
+# the second one has a float cost (see rule R15)
+SHAPES = [parse_frets(shape) for shape in ('x32010', '133211', '022100', ['x', 10, 12, 12, 12, 10])]
+
+
+@pytest.fixture(scope='module')
+def table_file(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('answers') / 'answers.bin')
+    assert build_answer_table(filename, SHAPES, processes=1) == 4
+    return filename
+
+
+def test_answer_table_matches_the_live_answers(table_file):
+    table = load_answer_table(table_file)
+    assert len(table) == 4
+    for shape in SHAPES:
+        answer = table.lookup(shape)
+        assert answer == compute_answer(shape), shape
+        assert type(answer[2]) is type(compute_answer(shape)[2]), shape
+    assert table.lookup('x32013') is None
+    assert 'x32013' not in table
+
+
+def test_answer_table_of_another_version_is_ignored(table_file):
+    with pytest.warns(UserWarning, match='another version'):
+        assert load_answer_table(table_file, version='0' * 40) is None
+    assert load_answer_table(table_file + '.missing') is None
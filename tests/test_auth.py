@@ -0,0 +1,65 @@
+import base64
+import contextlib
+
+import pytest
+from sqlalchemy import event
+
+import frets
+
+SHAPE = {'frets': ['x', 0, 2, 2, 1, 0]}
+
+
+@pytest.fixture(scope='module')
+def app_client():
+    with frets.app.app_context():
+        frets.db.create_all()
+        if frets.User.query.filter_by(email='auth@example.com').first() is None:
+            frets.db.session.add(frets.User(email='auth@example.com', password='secret'))
+            frets.db.session.commit()
+    return frets.app.test_client()
+
+
+def basic(email, password):
+    credentials = base64.b64encode(('%s:%s' % (email, password)).encode('utf-8'))
+    return {'Authorization': 'Basic ' + credentials.decode('ascii')}
+
+
+def bearer(token):
+    return {'Authorization': 'Bearer ' + token}
+
+
+@contextlib.contextmanager
+def count_queries():
+    """ Yields the list of the SQL statements run meanwhile """
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    with frets.app.app_context():
+        engine = frets.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_token_requests_do_not_query_the_database(app_client):
+    response = app_client.post('/api/v1/token', headers=basic('auth@example.com', 'secret'))
+    assert response.status_code == 200
+    token = response.get_json()['token']
+    with count_queries() as statements:
+        assert app_client.post('/api/v1/frets/', json=SHAPE, headers=bearer(token)).status_code == 200
+        # verified credentials are cached too
+        assert app_client.post('/api/v1/token', headers=basic('auth@example.com', 'secret')).status_code == 200
+    assert statements == []
+
+
+def test_invalid_credentials_and_tokens_are_rejected(app_client, monkeypatch):
+    assert app_client.post('/api/v1/token', headers=basic('auth@example.com', 'wrong')).status_code == 401
+    assert app_client.post('/api/v1/token', headers=basic('nobody@example.com', 'secret')).status_code == 401
+    with frets.app.app_context():
+        token = frets.generate_auth_token(1)
+    assert app_client.post('/api/v1/frets/', json=SHAPE, headers=bearer(token + 'x')).status_code == 401
+    monkeypatch.setitem(frets.app.config, 'TOKEN_EXPIRATION', -1)
+    assert app_client.post('/api/v1/frets/', json=SHAPE, headers=bearer(token)).status_code == 401
@@ -0,0 +1,36 @@
+from utils import benchmark
+
+
+def summary(n, p50, p95):
+    return {'n': n, 'mean_ms': p50, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p95}
+
+
+def test_summarize():
+    result = benchmark.summarize([float(i) for i in range(1, 101)])
+    assert result['n'] == 100
+    assert result['mean_ms'] == 50.5
+    assert result['p50_ms'] == 50.5
+    assert 95 <= result['p95_ms'] <= 96
+    assert benchmark.summarize([])['n'] == 0
+
+
+def test_compare_to_baseline_flags_slower_percentiles():
+    baseline = {'a': summary(100, 1., 2.), 'b': summary(100, 1., 2.)}
+    results = {'a': summary(100, 1.5, 2.), 'b': summary(100, 1.1, 2.2), 'c': summary(100, 9., 9.)}
+    regressions = benchmark.compare_to_baseline(results, baseline, tolerance=0.25)
+    assert [(r['benchmark'], r['percentile']) for r in regressions] == [('a', 'p50_ms')]
+
+
+def test_compare_to_baseline_skips_small_buckets_and_tiny_differences():
+    n = benchmark.MIN_COMPARED_SHAPES
+    baseline = {'small': summary(n - 1, 1., 1.), 'fast': summary(n, .01, .01)}
+    results = {'small': summary(n - 1, 5., 5.), 'fast': summary(n, .03, .03)}
+    assert benchmark.compare_to_baseline(results, baseline) == []
+
+
+def test_predict_fingering_buckets():
+    shapes = [(-1, 0, 2, 2, 1, 0), (-1, 3, 2, 0, 1, 0), (1, 3, 3, 2, 1, 1)]
+    results = benchmark.run_benchmarks(shapes, suites=('predict_fingering', 'identify'), repeat=1)
+    assert results['identify']['n'] == 3
+    assert sum(s['n'] for name, s in results.items() if name.startswith('predict_fingering/')) == 3
+    assert 'predict_fingering/3_fretted/no_thumb_pass' in results
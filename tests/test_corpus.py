@@ -0,0 +1,43 @@
+import csv
+import os
+import subprocess
+import sys
+
+from utils.fingering_rules import predict_fingering
+from utils.shapes import parse_frets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# valid shapes (some repeated, across chunks), then unreadable shapes: 5
+# strings, a fret beyond the reach of the rules, and no frets at all
+INPUT_SHAPES = ['x-3-2-0-1-0', '0-0-2-2-2-0', 'x-3-2-0-1-0', '1-3-3-2-1-1', 'x-10-12-12-12-10',
+                '0-0-2-2-2', '30-0-0-0-0-0', 'abc', '0-0-2-2-2-0']
+
+
+def test_corpus_cli_writes_a_row_per_input_row(tmp_path):
+    input_file = str(tmp_path / 'corpus.csv')
+    output_file = str(tmp_path / 'analysed.csv')
+    with open(input_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Fret Positions', 'notes'])
+        writer.writerows([shape, ''] for shape in INPUT_SHAPES)
+
+    result = subprocess.run([sys.executable, '-m', 'utils.corpus', input_file, output_file,
+                             '--processes', '1', '--chunk-rows', '2'],
+                            cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "%d rows written to %s" % (len(INPUT_SHAPES), output_file)
+
+    with open(output_file, 'r', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len(INPUT_SHAPES)
+    for shape, row in zip(INPUT_SHAPES, rows):
+        if shape in ('0-0-2-2-2', '30-0-0-0-0-0', 'abc'):
+            assert set(row.values()) == {''}, shape
+            continue
+        fingering, cost = predict_fingering(parse_frets(shape.split('-')))
+        assert row['Fret Positions'] == shape
+        assert row['Finger Positions'] == '-'.join(fingering)
+        assert row['Overall Cost'] == str(cost)
+    assert rows[0] == rows[2]
+    assert (rows[0]['Chord Name'], rows[0]['Fundamental']) == ('Cmajor', 'C')
@@ -0,0 +1,72 @@
+import csv
+import itertools
+import os
+
+import pytest
+
+from utils import fingering_rules
+from utils.answer_table import playable_shapes
+from utils.corpus import read_shapes
+from utils.identify import remove_duplicates
+from utils.shapes import MUTED
+
+CORPUS = os.path.join(os.path.dirname(fingering_rules.__file__), 'test2.csv')
+# fingerings and costs of the original predict_fingering, before the search
+# engines, on the distinct shapes of the corpus and a sample of the
+# playable shapes
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline_fingerings.csv')
+
+
+def sample_shapes():
+    """ Shapes of the corpus, then playable shapes (some needing the thumb) """
+    with open(CORPUS, 'r', newline='') as csvfile:
+        shapes = [shape for shape in read_shapes(csvfile) if shape is not None]
+    shapes = remove_duplicates(shapes)[::8]
+    shapes += itertools.islice(playable_shapes(max_span=4, max_fret=12), 0, None, 20000)
+    return [shape for shape in shapes if any(ft != MUTED for ft in shape)]
+
+
+def baseline_fingerings():
+    """ (frets, fingering, cost) rows of the baseline, costs keeping their type """
+    with open(BASELINE, 'r', newline='') as csvfile:
+        return [(row['Fret Positions'].split('-'), row['Fingers'].split('-'),
+                 float(row['Cost']) if '.' in row['Cost'] else int(row['Cost']))
+                for row in csv.DictReader(csvfile)]
+
+
+SHAPES = sample_shapes()
+BASELINE_FINGERINGS = baseline_fingerings()
+
+
+@pytest.mark.parametrize('engine', [None] + sorted(fingering_rules.search_engines))
+def test_engines_agree_with_the_baseline(engine):
+    fingering_rules.fingering_cache.clear()
+    for frets, fingering, cost in BASELINE_FINGERINGS:
+        found = fingering_rules.predict_fingering(frets, engine=engine)
+        assert found == (fingering, cost), frets
+        assert type(found[1]) is type(cost), frets
+
+
+@pytest.mark.parametrize('engine', sorted(fingering_rules.search_engines))
+def test_engines_agree_with_predict_fingering(engine):
+    for shape in SHAPES:
+        expected = fingering_rules.predict_fingering(shape)
+        assert fingering_rules.predict_fingering(shape, engine=engine, use_cache=False) == expected, shape
+
+
+def test_cached_search_agrees_with_predict_fingering():
+    fingering_rules.fingering_cache.clear()
+    for shape in SHAPES:
+        expected = fingering_rules.predict_fingering(shape, use_cache=False)
+        # first search fills the cache, the second one reads it
+        assert fingering_rules.predict_fingering(shape) == expected, shape
+        assert fingering_rules.predict_fingering(shape) == expected, shape
+
+
+def test_best_fingerings_start_with_the_best_one():
+    for shape in SHAPES[::4]:
+        fingering, cost = fingering_rules.predict_fingering(shape, use_cache=False)
+        best = fingering_rules.predict_fingerings(shape, 3, use_cache=False)
+        assert best[0] == [fingering, cost]
+        costs = [c for _, c in best]
+        assert costs == sorted(costs)
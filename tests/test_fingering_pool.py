@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+from utils.fingering_pool import FingeringUnavailable, load_fingering_pool
+from utils.fingering_rules import predict_fingering, predict_fingerings
+
+
+@pytest.fixture
+def pool():
+    pool = load_fingering_pool(1, max_pending=4, timeout=0.01)
+    yield pool
+    pool.close()
+
+
+def test_pool_starts_with_the_app(pool):
+    assert pool._pool is not None
+
+
+def test_pool_matches_the_search_in_process(pool):
+    pool.timeout = 2.
+    assert list(pool.predict_fingering('x32010')) == list(predict_fingering('x32010'))
+    assert pool.predict_fingerings('x32010', k=2) == predict_fingerings('x32010', k=2)
+    deadline = time.monotonic() + 2.
+    assert pool.predict_fingering('x32010', deadline=deadline, return_search_complete=True)[-1]
+
+
+def test_timed_out_search_frees_the_worker(pool):
+    # the exhaustive search of this shape lasts longer than the timeout
+    for _ in range(3):
+        with pytest.raises(FingeringUnavailable):
+            pool.predict_fingering('x57775', engine='exhaustive')
+    # not queued behind the searches which timed out (about 30 ms each)
+    pool.timeout = 2.
+    start = time.monotonic()
+    pool.predict_fingering('x32010')
+    assert time.monotonic() - start < 0.02
@@ -0,0 +1,40 @@
+import pytest
+
+from utils.greene import (build_greene_index, greene_voicing, pattern_pitches,
+                          shape_pitches)
+from utils.shapes import parse_frets
+from utils.utilities import greene_table
+
+# semitones of the chord tones of some four-note chords, root first
+QUALITIES = {'maj7': (0, 4, 7, 11), 'm7': (0, 3, 7, 10), '7': (0, 4, 7, 10),
+             'm7b5': (0, 3, 6, 10), 'dim7': (0, 3, 6, 9)}
+
+
+def chord_pitches(pattern, tones, root):
+    """ Pitches of a Greene pattern (chord tone numbers, octaves of 12) on a chord """
+    return [root + 12 * (p // 12) + tones[p % 12] for p in pattern_pitches(pattern)]
+
+
+@pytest.mark.parametrize('quality', sorted(QUALITIES))
+def test_every_pattern_is_classified_as_its_voicing(quality):
+    for name, patterns in greene_table.items():
+        for pattern in patterns:
+            for root in (40, 45, 51):
+                pitches = chord_pitches(pattern, QUALITIES[quality], root)
+                assert greene_voicing(pitches) == name, (pattern, quality, root)
+
+
+def test_voicings_of_shapes():
+    # drop 2 Cmaj7 (C G B E)
+    assert greene_voicing(shape_pitches(parse_frets('x3545x'))) == 'V-2'
+    # three notes, then a doubled note
+    assert greene_voicing(shape_pitches(parse_frets('x32010'))) is None
+    assert greene_voicing(shape_pitches(parse_frets('x3201x'))) is None
+    assert greene_voicing(shape_pitches(parse_frets('x3545x')) + [72]) is None
+
+
+def test_patterns_of_two_voicings_are_rejected():
+    with pytest.raises(ValueError):
+        build_greene_index({'V-1': ['BTAS'], 'copy': ['SBTA']})
+    with pytest.raises(ValueError):
+        pattern_pitches('BTA')
@@ -0,0 +1,22 @@
+import csv
+import os
+
+from utils.identify import identify, idntf
+
+# shapes labelled by the original identification (in lower case)
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'utils', 'test2.csv')
+
+
+def corpus_rows():
+    with open(CORPUS, 'r', newline='') as csvfile:
+        return [(row['Fret Positions'], row['chords']) for row in csv.DictReader(csvfile)]
+
+
+def test_identify_matches_the_corpus_labels():
+    idntf.chord_names_cache.clear()
+    # the second pass reads the cached names
+    for _ in range(2):
+        for frets, chords in corpus_rows():
+            assert ' '.join(identify(idntf.get_notes(frets), idntf)).lower() == chords, frets
+
@@ -0,0 +1,48 @@
+import itertools
+
+from utils.fingering_rules import predict_fingering, predict_fingerings
+from utils.progression import finger_places, fingering_progression, transition_cost
+from utils.shapes import parse_frets
+
+# C, Am, F, G7, C
+PROGRESSION = ['x32010', 'x02210', '133211', '320001', 'x32010']
+
+
+def test_progression_is_the_cheapest_sequence():
+    k = 3
+    fingerings, total, costs, transitions = fingering_progression(PROGRESSION, k, return_costs=True)
+    assert total == sum(costs) + sum(transitions)
+    assert transitions[0] == 0
+
+    # every sequence of the k best fingerings of each chord
+    shapes = [parse_frets(shape) for shape in PROGRESSION]
+    alternatives = [[(fgr, cost, finger_places(shape, fgr)) for fgr, cost in predict_fingerings(shape, k)]
+                    for shape in shapes]
+    best = min(sum(cost for _, cost, _ in sequence)
+               + sum(transition_cost(a[2], b[2]) for a, b in zip(sequence, sequence[1:]))
+               for sequence in itertools.product(*alternatives))
+    assert total == best
+
+
+def test_single_alternative_keeps_the_best_fingerings():
+    fingerings, _ = fingering_progression(PROGRESSION, 1)
+    assert fingerings == [predict_fingering(shape)[0] for shape in PROGRESSION]
+    assert fingering_progression([], 3) == ([], 0)
+
+
+def test_guide_finger_costs_nothing():
+    # Am to C: fingers 1 and 2 stay, finger 3 moves a fret up and from the D
+    # string to the A string (two strings, for both ends of the finger)
+    am = finger_places(parse_frets('x02210'), ['x', '0', '2', '3', '1', '0'])
+    c = finger_places(parse_frets('x32010'), ['x', '3', '2', '0', '1', '0'])
+    assert transition_cost(am, am) == 0
+    assert transition_cost(am, c) == 100 + 50 * 2 * 2
+
+
+def test_progression_endpoint(client):
+    response = client.post('/api/v1/progression/', json={'frets': [list(s) for s in PROGRESSION]})
+    assert response.status_code == 200
+    output = response.get_json()
+    assert len(output['fingers']) == len(output['costs']) == len(output['transition_costs']) == 5
+    response = client.post('/api/v1/progression/', json={'frets': [list('x32010'), [40, 0, 0, 0, 0, 0]]})
+    assert response.status_code == 400
@@ -0,0 +1,21 @@
+from utils.result_cache import ResultCache
+
+
+def test_result_cache_ignores_unpackable_shapes(tmp_path):
+    cache = ResultCache(str(tmp_path / 'results.sqlite'), version='tests')
+    cache.put([40, 0, 0, 0, 0, 0], {'cost': 0})
+    assert cache.get([40, 0, 0, 0, 0, 0]) is None
+    assert cache.get([-2, 0, 0, 0, 0, 0]) is None
+    cache.put(['x', 0, 2, 2, 1, 0], {'cost': 1})
+    assert cache.get(['x', 0, 2, 2, 1, 0]) == {'cost': 1}
+    info = cache.info()
+    assert (info['hits'], info['misses'], info['size']) == (1, 2, 1)
+
+
+def test_result_cache_is_shared_until_the_version_changes(tmp_path):
+    filename = str(tmp_path / 'results.sqlite')
+    ResultCache(filename, version='tests').put(['x', 3, 2, 0, 1, 0], {'cost': 798})
+    assert ResultCache(filename, version='tests').get(['x', 3, 2, 0, 1, 0]) == {'cost': 798}
+    cache = ResultCache(filename, version='other')
+    assert cache.get(['x', 3, 2, 0, 1, 0]) is None
+    assert len(cache) == 0
@@ -0,0 +1,35 @@
+import pytest
+
+
+@pytest.mark.parametrize('fret_positions', [
+    ['x', 0, 2, 2, 1, 0],
+    ['X', '0', '2', '2', '1', '0'],
+    [0, 24, 'x', 'x', 'x', 'x'],
+])
+def test_frets_accepts_valid_frets(client, fret_positions):
+    response = client.post('/api/v1/frets/', json={'frets': fret_positions})
+    assert response.status_code == 200
+    assert response.get_json()['fingers'] is not None
+
+
+@pytest.mark.parametrize('fret', [-1, -2, 25, 30, 40, 5.7, True, '5.7', '-1', None, 'y'])
+def test_frets_rejects_invalid_frets(client, fret):
+    response = client.post('/api/v1/frets/', json={'frets': [fret, 0, 2, 2, 1, 0]})
+    assert response.status_code == 400
+
+
+def test_batch_reports_errors_per_shape(client):
+    response = client.post('/api/v1/frets/batch', json={'frets': [
+        [40, 0, 0, 0, 0, 0],
+        ['x', 0, 2, 2, 1, 0],
+        [-2, 0, 0, 0, 0, 0],
+        [5, 'y'],
+        ['x', 0, 2, 2, 1, 0],
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert len(results) == 5
+    for i in (0, 2, 3):
+        assert set(results[i]) == {'error'}
+    assert results[1]['fingers'] == ['x', '0', '2', '3', '1', '0']
+    assert results[4] == results[1]
@@ -0,0 +1,44 @@
+import pytest
+
+from utils.answer_table import build_answer_table, compute_answer, load_answer_table
+from utils.voicings import VoicingIndex
+
+SHAPES = [(0, 0, 0, 0, 0, 0), (0, 2, 2, 0, 0, 0), (-1, 0, 2, 2, 1, 0), (5, 7, 7, 5, 5, 5),
+          (-1, -1, 7, 9, 10, 8), (-1, 12, 14, 14, 13, 12), (-1, 0, 2, 2, 2, 0)]
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('voicings') / 'answers.bin')
+    build_answer_table(filename, SHAPES, processes=1)
+    return VoicingIndex(load_answer_table(filename))
+
+
+def test_voicings_are_sorted_by_cost_within_the_window(index):
+    voicings = index.find('Am', fret_min=0, fret_max=24)
+    assert voicings
+    costs = [cost for _, _, cost in voicings]
+    assert costs == sorted(costs)
+    for frets, fingering, cost in voicings:
+        assert 'Am' in compute_answer(frets)[0]
+        assert (fingering, cost) == compute_answer(frets)[1:]
+    assert index.find('Am', k=1) == voicings[:1]
+
+
+def test_window_applies_to_fretted_strings_only(index):
+    for frets, _, _ in index.find('Am', fret_min=5, fret_max=8):
+        assert all(ft == -1 or ft == 0 or 5 <= ft <= 8 for ft in frets)
+    assert [frets for frets, _, _ in index.find('Am', fret_min=12, fret_max=14)] == \
+        [(-1, 12, 14, 14, 13, 12)]
+
+
+def test_shapes_without_fretted_string_fit_every_window(index):
+    name = compute_answer((0, 0, 0, 0, 0, 0))[0][0]
+    for fret_min, fret_max in ((0, 24), (3, 5), (20, 24)):
+        assert (0, 0, 0, 0, 0, 0) in [frets for frets, _, _ in
+                                      index.find(name, fret_min=fret_min, fret_max=fret_max)]
+
+
+def test_unknown_chord_has_no_voicings(index):
+    assert index.find('H7') == []
+    assert 'H7' not in index
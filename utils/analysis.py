@@ -0,0 +1,175 @@
+# ===========================
+# Modules
+# ===========================
+import sys
+import time
+import traceback
+##### Home-made modules #####
+from utils.fingering_pool import FingeringUnavailable
+from utils.fingering_rules import predict_fingering, predict_fingerings, compute_cost
+from utils.greene import shape_pitches, greene_voicing
+from utils.identify import idntf
+from utils.shapes import parse_frets
+
+
+# ===========================
+# Classes
+# ===========================
+class ShapeAnalysis:
+    """
+    Analysis of a shape in a single pass: the shape is parsed and its notes
+    derived once, then each stage adds its result from this shared state.
+
+    A stage whose result is already known (e.g. from a cache) or which is
+    not requested is skipped. A stage that fails gets a None result, its
+    traceback is printed (unless the fingering was only unavailable, see
+    utils.fingering_pool) and the other stages still run.
+
+    Attributes
+    ----------
+    frets : tuple
+        Fret numbers of the strings (see utils.shapes).
+    pitches : list
+        MIDI note number of each played string, from the low-pitched E string.
+    pitch_classes : list
+        Pitch class of each played string, from the low-pitched E string.
+    notes : list
+        Note names of the played strings.
+    bass : int
+        Pitch class of the lowest played string, None if all are muted.
+    results : dict
+        Result of each stage run or provided.
+    provided : set
+        Stages whose result was provided.
+    timings : dict
+        Duration of each stage run, in seconds.
+    errors : dict
+        Exception raised by each stage which failed.
+    predict : function
+        Function predicting the fingering of the shape, and its cost.
+    deadline : float
+        `time.monotonic()` value at which the fingering search must stop,
+        None for no limit.
+    search_complete : bool
+        Whether the fingering searches completed before the deadline.
+    predict_alternatives : function
+        Function predicting the best fingerings of the shape.
+    alternatives : int
+        Number of fingerings of the alternatives stage.
+    """
+
+    # alternatives runs before fingers, which reuses its best fingering
+    stages = ('chord_names', 'alternatives', 'fingers', 'greene_voicing', 'cost',
+              'rule_breakdown')
+    # stages run when none are requested
+    default_stages = ('chord_names', 'fingers', 'greene_voicing')
+
+    def __init__(self, fret_positions, results=None, predict=predict_fingering, deadline=None,
+                 predict_alternatives=predict_fingerings, alternatives=3):
+        self.frets = parse_frets(fret_positions)
+        self.pitches = shape_pitches(self.frets)
+        self.pitch_classes = idntf.pitch_classes_for_frets(self.frets)
+        self.notes = [idntf.notes[pc] for pc in self.pitch_classes]
+        self.bass = self.pitch_classes[0] if self.pitch_classes else None
+        self.results = dict(results or {})
+        self.provided = set(self.results)
+        self.timings = dict()
+        self.errors = dict()
+        self.predict = predict
+        self.deadline = deadline
+        self.search_complete = True
+        self.predict_alternatives = predict_alternatives
+        self.alternatives = alternatives
+
+    def run(self, stages=None):
+        """
+        Run the stages (the default ones if None) whose result is not known
+        yet, and return the results.
+        """
+
+        if stages is None:
+            stages = self.default_stages
+        for stage in self.stages:
+            if stage not in stages or stage in self.results:
+                continue
+            start = time.perf_counter()
+            try:
+                self.results[stage] = getattr(self, 'stage_' + stage)()
+            except FingeringUnavailable as e:
+                self.results[stage] = None
+                self.errors[stage] = e
+            except Exception as e:
+                self.results[stage] = None
+                self.errors[stage] = e
+                _print_exception()
+            self.timings[stage] = time.perf_counter() - start
+        return self.results
+
+    def stage_chord_names(self):
+        """ Returns chord names of the shape """
+        return idntf.chord_names_for_pitch_classes(self.pitch_classes) or None
+
+    def stage_fingers(self):
+        """ Returns fingers of the shape (and keeps their cost) """
+        fingers, self.results['cost'] = self._predict()
+        return fingers or None
+
+    def stage_cost(self):
+        """ Returns the cost of the fingers of the shape """
+        fingers, cost = self._predict()
+        self.results.setdefault('fingers', fingers or None)
+        return cost
+
+    def stage_rule_breakdown(self):
+        """ Returns the cost of each rule broken by the fingers of the shape """
+        fingers = self.run(['fingers'])['fingers']
+        if fingers is None:
+            return None
+        _, rules_dict = compute_cost(fingers, self.frets, return_rules_importance=True)
+        return {R: Rc for R, Rc in rules_dict.items() if Rc != 0}
+
+    def _predict(self):
+        if self.deadline is None:
+            return self.predict(self.frets)
+        fingers, cost, complete = self.predict(self.frets, deadline=self.deadline,
+                                               return_search_complete=True)
+        self.search_complete = self.search_complete and complete
+        return fingers, cost
+
+    def stage_alternatives(self):
+        """
+        Returns the best fingerings of the shape with their cost and the
+        rules they break (and keeps the best one and its cost)
+        """
+        if self.deadline is None:
+            fingerings = self.predict_alternatives(self.frets, self.alternatives,
+                                                   return_rules_str=True)
+        else:
+            fingerings, complete = self.predict_alternatives(
+                self.frets, self.alternatives, deadline=self.deadline,
+                return_search_complete=True, return_rules_str=True)
+            self.search_complete = self.search_complete and complete
+        fingers, cost, _ = fingerings[0]
+        self.results.setdefault('fingers', fingers or None)
+        self.results.setdefault('cost', cost)
+        return [{'fingers': fingers, 'cost': cost, 'rules': rules}
+                for fingers, cost, rules in fingerings]
+
+    def stage_greene_voicing(self):
+        """ Returns the Greene voicing of the shape if it has 4 distinct notes """
+        return greene_voicing(self.pitches)
+
+
+# ===========================
+# Functions
+# ===========================
+def _print_exception():
+    """
+    Prints the traceback of the latest exception.
+    Used in cases where logic code fails
+    """
+
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    traceback.print_tb(exc_traceback, limit=1, file=sys.stdout)
+    traceback.print_exception(exc_type, exc_value, exc_traceback,
+                              limit=2, file=sys.stdout)
@@ -0,0 +1,249 @@
+# ===========================
+# Modules
+# ===========================
+import argparse
+import itertools
+import mmap
+import struct
+import warnings
+from multiprocessing import Pool
+import numpy as np
+##### Home-made modules #####
+from utils import utilities
+from utils.fingering_rules import predict_fingering
+from utils.identify import identify, idntf
+from utils.result_cache import results_version
+from utils.shapes import N_STRINGS, MUTED, MAX_FRET, parse_frets, pack_frets
+
+
+# ===========================
+# Constants
+# ===========================
+# file layout: header (with the results version of the logic code which
+# computed the answers, see utils.result_cache), then the arrays below, then
+# the chord names blob
+#   keys        uint32[n_shapes]  packed shapes, sorted
+#   fingerings  uint32[n_shapes]  3 bits per string, FLOAT_COST_FLAG if the cost is a float
+#   costs       float64[n_shapes]
+#   name_ids    uint32[n_shapes]  index of the chord names list of each shape
+#   offsets     uint32[n_lists+1] start of each chord names list in the blob
+MAGIC = b'FRTA'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sIIII20s12x')
+
+FINGER_BITS = 3
+FINGER_MASK = (1 << FINGER_BITS) - 1
+MUTED_FINGER = FINGER_MASK
+FLOAT_COST_FLAG = 1 << 31
+
+
+# ===========================
+# Classes
+# ===========================
+class AnswerTable:
+    """
+    Precomputed chord names, fingering and cost of a set of shapes, read
+    from a file built by `build_answer_table`. The file is memory-mapped,
+    so the processes serving the API share a single copy of it.
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_shapes, n_lists, blob_size, results = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("%s is not an answer table of version %d" % (filename, FORMAT_VERSION))
+        self.version = results.hex()
+        offset = HEADER.size
+        self.keys = np.frombuffer(self._mm, dtype='<u4', count=n_shapes, offset=offset)
+        offset += 4 * n_shapes
+        self.fingerings = np.frombuffer(self._mm, dtype='<u4', count=n_shapes, offset=offset)
+        offset += 4 * n_shapes
+        self.costs = np.frombuffer(self._mm, dtype='<f8', count=n_shapes, offset=offset)
+        offset += 8 * n_shapes
+        self.name_ids = np.frombuffer(self._mm, dtype='<u4', count=n_shapes, offset=offset)
+        offset += 4 * n_shapes
+        self.offsets = np.frombuffer(self._mm, dtype='<u4', count=n_lists + 1, offset=offset)
+        offset += 4 * (n_lists + 1)
+        self._blob_offset = offset
+
+    def lookup(self, fret_positions):
+        """
+        Returns (chord_names, fingering, cost) of a shape, or None when the
+        shape is not in the table.
+        """
+
+        try:
+            key = pack_frets(parse_frets(fret_positions))
+        except ValueError:
+            return None
+        i = int(np.searchsorted(self.keys, key))
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        chord_names = self.chord_names(int(self.name_ids[i]))
+        fingering, cost = unpack_answer(int(self.fingerings[i]), self.costs[i])
+        return chord_names, fingering, cost
+
+    def chord_names(self, name_id):
+        """ Returns the chord names list stored under name_id. """
+
+        start = self._blob_offset + int(self.offsets[name_id])
+        end = self._blob_offset + int(self.offsets[name_id + 1])
+        return self._mm[start:end].decode('utf-8').split('\n') if end > start else []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, fret_positions):
+        return self.lookup(fret_positions) is not None
+
+
+# ===========================
+# Functions
+# ===========================
+def load_answer_table(filename, version=None):
+    """
+    Returns the answer table stored in filename, or None if there is none,
+    or (with a warning) if it was built by another version of the logic
+    code (`results_version` by default) and its answers may be stale.
+    """
+
+    try:
+        table = AnswerTable(filename)
+    except IOError:
+        return None
+    except ValueError as e:
+        warnings.warn("Answer table ignored: %s" % e)
+        return None
+    if table.version != (version or results_version()):
+        warnings.warn("Answer table %s ignored: it was built by another version of the logic "
+                      "code, rebuild it with `python -m utils.answer_table`" % filename)
+        return None
+    return table
+
+
+def playable_shapes(max_span=4, max_fret=24):
+    """
+    Generate the shapes whose fretted strings are at most max_span frets
+    apart, within the reach of the hand at their position (see R3).
+    """
+
+    choices = [MUTED, 0]
+    yield from itertools.product(choices, repeat=N_STRINGS)
+    for fret_first in range(1, max_fret + 1):
+        span = min(max_span, utilities.finger_span[fret_first], max_fret - fret_first)
+        frets = choices + list(range(fret_first, fret_first + span + 1))
+        for shape in itertools.product(frets, repeat=N_STRINGS):
+            if fret_first in shape:
+                yield shape
+
+
+def compute_answer(frets):
+    """ Returns (chord_names, fingering, cost) of a shape, computed live. """
+
+    try:
+        chord_names = identify(idntf.notes_for_frets(frets), idntf)
+    except Exception:
+        chord_names = []
+    fingering, cost = predict_fingering(frets)
+    return chord_names, fingering, cost
+
+
+def pack_answer(fingering, cost):
+    """ Pack a fingering and the type of its cost into an integer. """
+
+    code = 0
+    for i, fg in enumerate(fingering):
+        code |= (MUTED_FINGER if fg == 'x' else int(fg)) << (FINGER_BITS * i)
+    if isinstance(cost, float):
+        code |= FLOAT_COST_FLAG
+    return code
+
+
+def unpack_answer(code, cost):
+    """ Unpack a fingering packed by `pack_answer` and restore the type of its cost. """
+
+    fingering = []
+    for i in range(N_STRINGS):
+        fg = (code >> (FINGER_BITS * i)) & FINGER_MASK
+        fingering.append('x' if fg == MUTED_FINGER else str(fg))
+    cost = float(cost) if code & FLOAT_COST_FLAG else int(cost)
+    return fingering, cost
+
+
+def build_answer_table(filename, shapes=None, processes=None, chunksize=256):
+    """
+    Compute the answers of shapes (all the `playable_shapes` by default)
+    and write them to filename.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the table to write.
+    shapes : iterable
+        Shapes to include (see utils.shapes).
+    processes : int
+        Number of worker processes, all the CPUs if None.
+    chunksize : int
+        Number of shapes sent to a worker at once.
+
+    Returns
+    -------
+    n_shapes : int
+        Number of shapes written.
+    """
+
+    if shapes is None:
+        shapes = playable_shapes()
+    shapes = sorted(set(parse_frets(shape) for shape in shapes), key=pack_frets)
+
+    name_lists = {}
+    blob = bytearray()
+    offsets = []
+    keys = np.empty(len(shapes), dtype='<u4')
+    fingerings = np.empty(len(shapes), dtype='<u4')
+    costs = np.empty(len(shapes), dtype='<f8')
+    name_ids = np.empty(len(shapes), dtype='<u4')
+    with Pool(processes) as pool:
+        answers = pool.imap(compute_answer, shapes, chunksize)
+        for i, (shape, (chord_names, fingering, cost)) in enumerate(zip(shapes, answers)):
+            names = '\n'.join(chord_names)
+            if names not in name_lists:
+                name_lists[names] = len(offsets)
+                offsets.append(len(blob))
+                blob += names.encode('utf-8')
+            keys[i] = pack_frets(shape)
+            fingerings[i] = pack_answer(fingering, cost)
+            costs[i] = cost
+            name_ids[i] = name_lists[names]
+    offsets.append(len(blob))
+
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(shapes), len(name_lists), len(blob),
+                            bytes.fromhex(results_version())))
+        for array in (keys, fingerings, costs, name_ids, np.array(offsets, dtype='<u4')):
+            f.write(array.tobytes())
+        f.write(bytes(blob))
+    return len(shapes)
+
+
+
+# ===========================
+# Main
+# ===========================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Build the answer table of the playable shapes.')
+    parser.add_argument('filename', help='path of the table to write')
+    parser.add_argument('--max-span', type=int, default=4,
+                        help='largest distance between the fretted strings of a shape')
+    parser.add_argument('--max-fret', type=int, default=24, choices=range(1, MAX_FRET + 1),
+                        metavar='MAX_FRET', help='highest fret of the shapes')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (all the CPUs by default)')
+    args = parser.parse_args()
+
+    n_shapes = build_answer_table(args.filename,
+                                  playable_shapes(args.max_span, args.max_fret),
+                                  processes=args.processes)
+    print("%d shapes written to %s" % (n_shapes, args.filename))
@@ -0,0 +1,276 @@
+# ===========================
+# Modules
+# ===========================
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+##### Home-made modules #####
+from utils import utilities, fingering_rules, fingering_vectorized
+from utils.answer_table import playable_shapes
+from utils.corpus import read_shapes
+from utils.fingering_rules import predict_fingering, fingering_cache
+from utils.identify import identify, idntf, remove_duplicates
+from utils.shapes import MUTED, format_frets
+
+
+# ===========================
+# Constants
+# ===========================
+# shapes timed, with a sample of the playable shapes (those of the corpus
+# never need the thumb)
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test2.csv')
+
+# number of playable shapes (up to fret 12) added to the corpus
+DEFAULT_SAMPLE = 500
+
+# calls timed for each shape
+DEFAULT_REPEAT = 3
+
+PERCENTILES = (50, 95, 99)
+
+# percentiles compared to the baseline (p99 is mostly the slowest shape of a
+# bucket), which regress when this much slower than in the baseline, and by
+# MIN_REGRESSION_MS at least (shorter differences are timer noise), in the
+# benchmarks timing MIN_COMPARED_SHAPES shapes at least on both sides (the
+# percentiles of fewer shapes are mostly noise too)
+COMPARED_PERCENTILES = (50, 95)
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_MS = 0.05
+MIN_COMPARED_SHAPES = 20
+
+SUITES = ('predict_fingering', 'identify', 'calculate_output', 'endpoint')
+
+
+# ===========================
+# Functions
+# ===========================
+def run_benchmarks(shapes, suites=SUITES, repeat=DEFAULT_REPEAT):
+    """
+    Time the given suites on each shape, with the in-process caches cleared
+    before each call (see `clear_caches`), so that the timings measure the
+    computations rather than the cache lookups.
+
+    Parameters
+    ----------
+    shapes : list
+        Shapes (see utils.shapes) to time.
+    suites : tuple
+        Suites to run, among `SUITES`.
+    repeat : int
+        Number of times each shape is timed (see `time_calls`).
+
+    Returns
+    -------
+    results : dict
+        Summary of the timings of each benchmark (see `summarize`), by name.
+    """
+
+    # the app is loaded first, so that whatever it sets up at import applies
+    # to every suite alike
+    frets = _load_app() if 'calculate_output' in suites or 'endpoint' in suites else None
+    results = {}
+    if 'predict_fingering' in suites:
+        results.update(bench_predict_fingering(shapes, repeat))
+    if 'identify' in suites:
+        results['identify'] = summarize(time_calls(_identify, shapes, repeat))
+    if 'calculate_output' in suites:
+        with frets.app.app_context():
+            results['calculate_output'] = summarize(time_calls(
+                lambda shape: frets.calculate_output(format_frets(shape)), shapes, repeat))
+    if 'endpoint' in suites:
+        results['endpoint'] = summarize(time_calls(_endpoint_client(frets), shapes, repeat))
+    return results
+
+
+def bench_predict_fingering(shapes, repeat=DEFAULT_REPEAT):
+    """
+    Time `predict_fingering` on each shape, by number of fretted strings and
+    by whether the search takes the thumb into account (see
+    `runs_thumb_pass`).
+    """
+
+    buckets = {}
+    for frets in shapes:
+        n_fretted = sum(1 for ft in frets if ft > 0)
+        thumb = 'thumb_pass' if runs_thumb_pass(frets) else 'no_thumb_pass'
+        buckets.setdefault('predict_fingering/%d_fretted/%s' % (n_fretted, thumb), []).append(frets)
+    return dict((name, summarize(time_calls(predict_fingering, bucket, repeat)))
+                for name, bucket in sorted(buckets.items()))
+
+
+def runs_thumb_pass(frets, strummable=True):
+    """
+    Whether the fingering search of a shape takes the thumb into account,
+    that is whether its best fingering without thumb costs more than
+    `utilities.cost_threshold`.
+    """
+
+    frets = fingering_vectorized.encode_frets(frets)
+    costs, _ = fingering_vectorized.compute_costs(
+        fingering_vectorized.candidate_fingerings(frets), frets, strummable=strummable)
+    return bool(costs.min() > utilities.cost_threshold)
+
+
+def time_calls(function, shapes, repeat=DEFAULT_REPEAT):
+    """
+    Returns the duration of function on each shape, in milliseconds: the
+    shortest of repeat calls, the longer ones being slowed down by the rest
+    of the machine.
+    """
+
+    durations = []
+    for frets in shapes:
+        duration = float('inf')
+        for _ in range(repeat):
+            clear_caches()
+            start = time.perf_counter()
+            function(frets)
+            duration = min(duration, time.perf_counter() - start)
+        durations.append(1000. * duration)
+    return durations
+
+
+def clear_caches():
+    """ Empty the in-process caches of the fingerings and the chord names. """
+    fingering_cache.clear()
+    idntf.chord_names_cache.clear()
+
+
+def summarize(durations):
+    """ Returns the number of timings, their mean and their percentiles. """
+
+    summary = {'n': len(durations), 'mean_ms': float(np.mean(durations)) if durations else 0.}
+    for p in PERCENTILES:
+        summary['p%d_ms' % p] = float(np.percentile(durations, p)) if durations else 0.
+    return summary
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns the regressions of results against a baseline (both as written
+    by `run_benchmarks`): the COMPARED_PERCENTILES more than tolerance (a
+    fraction) and MIN_REGRESSION_MS slower than in the baseline. Benchmarks
+    missing from either side, or timing fewer than MIN_COMPARED_SHAPES
+    shapes on either side, are not compared.
+    """
+
+    regressions = []
+    for name in sorted(set(results) & set(baseline)):
+        if min(results[name].get('n', 0), baseline[name].get('n', 0)) < MIN_COMPARED_SHAPES:
+            continue
+        for p in COMPARED_PERCENTILES:
+            key = 'p%d_ms' % p
+            before, after = baseline[name].get(key), results[name].get(key)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + tolerance) and after - before > MIN_REGRESSION_MS:
+                regressions.append({'benchmark': name, 'percentile': key,
+                                    'baseline_ms': before, 'ms': after,
+                                    'ratio': after / before if before else float('inf')})
+    return regressions
+
+
+def benchmark_shapes(corpus=DEFAULT_CORPUS, sample=DEFAULT_SAMPLE):
+    """
+    Returns the distinct shapes of a CSV corpus (see utils.corpus), then
+    sample shapes spread evenly over the playable shapes up to fret 12.
+    Shapes with every string muted are left out: they have no chord.
+    """
+
+    with open(corpus, 'r', newline='') as csvfile:
+        shapes = [shape for shape in read_shapes(csvfile) if shape is not None]
+    if sample:
+        n_playable = sum(1 for _ in playable_shapes(max_fret=12))
+        shapes += itertools.islice(playable_shapes(max_fret=12), 0, None,
+                                   max(1, n_playable // sample))
+    return remove_duplicates(shape for shape in shapes if any(ft != MUTED for ft in shape))
+
+
+def _identify(frets):
+    try:
+        return identify(idntf.notes_for_frets(frets), idntf)
+    except Exception:
+        return []
+
+
+def _load_app():
+    """ Returns the frets module, serving on an in-memory database and computing every answer. """
+
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['ANSWER_TABLE'] = ''
+    os.environ['RESULT_CACHE'] = ''
+    os.environ['FINGERING_PROCESSES'] = '0'
+    import frets
+    return frets
+
+
+def _endpoint_client(frets):
+    """ Returns a function posting a shape to the frets endpoint of the app. """
+
+    with frets.app.app_context():
+        frets.db.create_all()
+        user = frets.User(email='benchmark@example.com', password='benchmark')
+        frets.db.session.add(user)
+        frets.db.session.commit()
+        headers = {'Authorization': 'Bearer ' + frets.generate_auth_token(user.id)}
+    client = frets.app.test_client()
+
+    def post(shape):
+        response = client.post('/api/v1/frets/', json={'frets': format_frets(shape)},
+                               headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError("frets endpoint answered %d: %s"
+                               % (response.status_code, response.get_data(as_text=True)))
+        return response
+    return post
+
+
+# ===========================
+# Main
+# ===========================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time the fingering, the identification and the API.')
+    parser.add_argument('output', help='path of the JSON results to write')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON results of an earlier run to flag the regressions against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='slowdown of a percentile flagged as a regression (0.25 for 25%%)')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS,
+                        help='CSV of the shapes to time, with a "Fret Positions" column')
+    parser.add_argument('--sample', type=int, default=DEFAULT_SAMPLE,
+                        help='number of playable shapes added to the corpus')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='number of times each shape is timed, the shortest time is kept')
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=SUITES,
+                        help='benchmarks to run')
+    args = parser.parse_args()
+
+    shapes = benchmark_shapes(args.corpus, args.sample)
+    results = run_benchmarks(shapes, args.suites, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump({'python': platform.python_version(),
+                   'machine': platform.machine(),
+                   'shapes': len(shapes),
+                   'repeat': args.repeat,
+                   'rule_order': list(fingering_rules.rule_order),
+                   'benchmarks': results}, f, indent=2, sort_keys=True)
+
+    for name, summary in sorted(results.items()):
+        print("%-45s n=%-5d p50=%8.3f ms  p95=%8.3f ms  p99=%8.3f ms"
+              % (name, summary['n'], summary['p50_ms'], summary['p95_ms'], summary['p99_ms']))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for r in regressions:
+            print("REGRESSION %s %s: %.3f ms -> %.3f ms (x%.2f)"
+                  % (r['benchmark'], r['percentile'], r['baseline_ms'], r['ms'], r['ratio']))
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,198 @@
+# ===========================
+# Modules
+# ===========================
+import argparse
+import csv
+import itertools
+import re
+from collections import deque
+from multiprocessing import Pool, cpu_count
+##### Home-made modules #####
+from utils import utilities
+from utils.caching import LRUCache
+from utils.fingering_rules import predict_fingering, compute_cost, rules_dict_to_str
+from utils.greene import shape_pitches, greene_voicing
+from utils.identify import idntf, remove_duplicates
+from utils.shapes import N_STRINGS, MUTED, parse_frets, format_frets
+
+
+# ===========================
+# Constants
+# ===========================
+# column of the input holding the shapes, e.g. '0-0-2-2-2-0'
+FRETS_COLUMN = 'Fret Positions'
+
+# highest fret of the shapes analysed (the hand span of the rules stops there)
+MAX_CORPUS_FRET = max(utilities.finger_span)
+
+# root note and bass note of a chord name, e.g. 'C#m7/E'
+CHORD_ROOT = re.compile(r'^[A-G]#?')
+CHORD_BASS = re.compile(r'/[A-G]#?$')
+
+
+# ===========================
+# Functions
+# ===========================
+def analyse_corpus(input_file, output_file, processes=None, strummable=True,
+                   chunk_rows=10000, cache_size=100000):
+    """
+    Analyse the shapes of a CSV corpus (e.g. utils/test2.csv) and write one
+    row per input row in the `utilities.data_columns` layout, in the input
+    order.
+
+    The input is streamed by chunks of rows: the distinct shapes of a chunk
+    not analysed lately (see cache_size) are sent to a pool of worker
+    processes while the previous chunk is written, so the memory used does
+    not depend on the size of the corpus.
+
+    Parameters
+    ----------
+    input_file : str
+        Path of the CSV to analyse, with a 'Fret Positions' column.
+    output_file : str
+        Path of the CSV to write.
+    processes : int
+        Number of worker processes, all the CPUs if None.
+    strummable : bool
+        Whether the chords are meant to be strummed (see rule R28).
+    chunk_rows : int
+        Number of input rows read at once.
+    cache_size : int
+        Number of analysed shapes kept to answer their next occurrences.
+
+    Returns
+    -------
+    n_rows : int
+        Number of rows written.
+    """
+
+    analysed = LRUCache(maxsize=cache_size)
+    in_flight = set()
+    pending = deque()
+    n_workers = processes or cpu_count()
+
+    def submit(chunk):
+        new_shapes = list()
+        for shape in chunk:
+            if shape is not None and shape not in in_flight and shape not in analysed:
+                new_shapes.append(shape)
+                in_flight.add(shape)
+        results = pool.map_async(analyse_shape, [(shape, strummable) for shape in new_shapes],
+                                 chunksize=max(1, len(new_shapes) // (4 * n_workers)))
+        pending.append((chunk, new_shapes, results))
+
+    def write():
+        chunk, new_shapes, results = pending.popleft()
+        for shape, row in zip(new_shapes, results.get()):
+            analysed.put(shape, row)
+            in_flight.discard(shape)
+        for shape in chunk:
+            writer.writerow(_output_row(shape, analysed, strummable))
+        return len(chunk)
+
+    n_rows = 0
+    with open(input_file, 'r', newline='') as fin, open(output_file, 'w', newline='') as fout, \
+            Pool(processes) as pool:
+        writer = csv.writer(fout)
+        writer.writerow(utilities.data_columns)
+        shapes = read_shapes(fin)
+        for chunk in iter(lambda: list(itertools.islice(shapes, chunk_rows)), []):
+            submit(chunk)
+            # the next chunk is searched while this one is written
+            if len(pending) > 1:
+                n_rows += write()
+        while pending:
+            n_rows += write()
+    return n_rows
+
+
+def read_shapes(csvfile):
+    """
+    Yields the shape of each row of a CSV corpus, None for the rows whose
+    fret positions cannot be read or are not 6 frets up to MAX_CORPUS_FRET.
+    """
+
+    reader = csv.DictReader(csvfile)
+    for row in reader:
+        try:
+            shape = parse_frets(row[FRETS_COLUMN].split('-'))
+        except (ValueError, AttributeError):
+            shape = None
+        if shape is not None and (len(shape) != N_STRINGS or any(
+                ft != MUTED and not 0 <= ft <= MAX_CORPUS_FRET for ft in shape)):
+            shape = None
+        yield shape
+
+
+def _output_row(shape, analysed, strummable):
+    if shape is None:
+        return [''] * len(utilities.data_columns)
+    row = analysed.get(shape)
+    if row is None:
+        # dropped from the cache before all the chunks using it were written
+        row = analyse_shape((shape, strummable))
+        analysed.put(shape, row)
+    return row
+
+
+def analyse_shape(args):
+    """
+    Identify and finger a shape, given with whether it is strummable.
+
+    Returns
+    -------
+    row : list
+        Values of the `utilities.data_columns` of the shape.
+    """
+
+    frets, strummable = args
+    fret_positions = format_frets(frets)
+    pitch_classes = [None if ft == MUTED else (idntf.open_note_indexes[i] + ft) % len(idntf.notes)
+                     for i, ft in enumerate(frets)]
+    played = [pc for pc in pitch_classes if pc is not None]
+    chord_names = idntf.chord_names_for_pitch_classes(played) if played else []
+    chord_name = chord_names[0] if chord_names else ''
+    root = CHORD_ROOT.match(chord_name)
+    fundamental = root.group() if root else ''
+    chord_type = CHORD_BASS.sub('', chord_name)[len(fundamental):]
+
+    fingering, cost = predict_fingering(frets, strummable)
+    _, rules_dict = compute_cost(fingering, frets, return_rules_importance=True, strummable=strummable)
+    rules_str, worst_rule = rules_dict_to_str(rules_dict)
+
+    note_names = ['' if pc is None else idntf.notes[pc] for pc in pitch_classes]
+    if fundamental:
+        root_pc = idntf.notes.index(fundamental)
+        intervals = ['' if pc is None else utilities.steps[(pc - root_pc) % 12] for pc in pitch_classes]
+        sorted_intervals = [utilities.steps[i] for i in sorted(set((pc - root_pc) % 12 for pc in played))]
+    else:
+        intervals = [''] * N_STRINGS
+        sorted_intervals = []
+
+    return ([chord_name, '; '.join(chord_names[1:]), fundamental, chord_type]
+            + fret_positions + fingering + intervals + note_names
+            + ['-'.join(fret_positions), '-'.join(fingering),
+               ' '.join(idntf.notes[pc] for pc in remove_duplicates(played)), ' '.join(sorted_intervals),
+               greene_voicing(shape_pitches(frets)) or '', cost, rules_str, worst_rule,
+               strummable])
+
+
+# ===========================
+# Main
+# ===========================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Identify and finger the shapes of a CSV corpus.')
+    parser.add_argument('input', help='path of the CSV to analyse, with a "%s" column' % FRETS_COLUMN)
+    parser.add_argument('output', help='path of the CSV to write')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (all the CPUs by default)')
+    parser.add_argument('--not-strummable', action='store_true',
+                        help='the chords are plucked rather than strummed (see rule R28)')
+    parser.add_argument('--chunk-rows', type=int, default=10000,
+                        help='number of input rows read at once')
+    args = parser.parse_args()
+
+    n_rows = analyse_corpus(args.input, args.output, processes=args.processes,
+                            strummable=not args.not_strummable, chunk_rows=args.chunk_rows)
+    print("%d rows written to %s" % (n_rows, args.output))
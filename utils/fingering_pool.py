@@ -0,0 +1,139 @@
+# ===========================
+# Modules
+# ===========================
+import multiprocessing
+import os
+import threading
+import time
+##### Home-made modules #####
+from utils.fingering_rules import predict_fingering, predict_fingerings
+from utils.shapes import MUTED
+
+
+# ===========================
+# Constants
+# ===========================
+# shape searched by each worker at startup, to load the rules tables
+WARMUP_SHAPE = (MUTED, 3, 2, 0, 1, 0)
+
+# seconds a result is waited for after the timeout, the search stopping at
+# the timeout in the worker
+RESULT_GRACE = 0.5
+
+
+# ===========================
+# Classes
+# ===========================
+class FingeringUnavailable(Exception):
+    """ Raised when the pool cannot predict a fingering in time. """
+
+
+class FingeringPool:
+    """
+    Pool of worker processes predicting fingerings, so that the search
+    runs outside the process serving the requests.
+
+    At most max_pending shapes are queued or searched at once: beyond that,
+    or when a search lasts longer than timeout seconds, `predict_fingering`
+    raises FingeringUnavailable instead of waiting. The workers stop the
+    search at the timeout (counted from the submission, queueing included),
+    so that a search which timed out frees its worker at once.
+    """
+
+    def __init__(self, processes=2, max_pending=32, timeout=2.):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Start the workers, rather than on the first shape searched. """
+        self._get_pool()
+
+    def _get_pool(self):
+        # the workers are started again in forked processes, the pool of
+        # the parent being unusable there
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = multiprocessing.Pool(self.processes, initializer=_init_worker)
+                self._pid = os.getpid()
+                self._pending = threading.BoundedSemaphore(self.max_pending)
+            return self._pool, self._pending
+
+    def predict_fingering(self, fret_positions, strummable=True, **kwargs):
+        """ Same as fingering_rules.predict_fingering, searched by a worker. """
+        return self._apply(predict_fingering, (fret_positions, strummable), kwargs)
+
+    def predict_fingerings(self, fret_positions, k=3, strummable=True, **kwargs):
+        """ Same as fingering_rules.predict_fingerings, searched by a worker. """
+        return self._apply(predict_fingerings, (fret_positions, k, strummable), kwargs)
+
+    def _apply(self, function, args, kwargs):
+        pool, pending = self._get_pool()
+        if not pending.acquire(blocking=False):
+            raise FingeringUnavailable("Fingering pool saturated (%d shapes pending)"
+                                       % self.max_pending)
+
+        def release(_):
+            pending.release()
+        deadline = time.monotonic() + self.timeout
+        try:
+            result = pool.apply_async(_predict, (function, args, kwargs, deadline),
+                                      callback=release, error_callback=release)
+        except Exception:
+            pending.release()
+            raise
+        try:
+            result = result.get(self.timeout + RESULT_GRACE)
+        except multiprocessing.TimeoutError:
+            result = None
+        if result is None:
+            raise FingeringUnavailable("Fingering search longer than %g s" % self.timeout)
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.terminate()
+                self._pool.join()
+            self._pool = None
+
+
+# ===========================
+# Functions
+# ===========================
+def _init_worker():
+    predict_fingering(WARMUP_SHAPE)
+
+
+def _predict(function, args, kwargs, deadline):
+    """
+    Runs function (`predict_fingering` or `predict_fingerings`) in a worker,
+    stopping the search at deadline, or at the deadline of the caller if
+    sooner. Returns None if the search stopped at deadline: the caller gave
+    up on it, rather than asking for the best fingering found in time.
+    """
+
+    caller_deadline = kwargs.get('deadline')
+    return_search_complete = kwargs.get('return_search_complete', False)
+    kwargs = dict(kwargs, return_search_complete=True,
+                  deadline=deadline if caller_deadline is None else min(caller_deadline, deadline))
+    result = function(*args, **kwargs)
+    if not result[-1] and (caller_deadline is None or deadline < caller_deadline):
+        return None
+    if return_search_complete:
+        return result
+    return result[0] if function is predict_fingerings else result[:-1]
+
+
+def load_fingering_pool(processes, max_pending=32, timeout=2.):
+    """ Returns a started fingering pool of processes workers, or None if processes is 0. """
+
+    if not processes:
+        return None
+    pool = FingeringPool(processes, max_pending, timeout)
+    pool.start()
+    return pool
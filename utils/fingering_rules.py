@@ -1,26 +1,353 @@
 # ===========================
 # Modules
 # ===========================
+import bisect
 import itertools
 import copy
+import time
 import numpy as np
 from operator import itemgetter
 ##### Home-made modules #####
 from utils.model_functions import fret_model_func, muted_model_func
 from utils import utilities
+from utils import fingering_vectorized
+from utils.caching import LRUCache
+from utils.shapes import MUTED, parse_frets, format_frets, pack_frets
+
+
+# ===========================
+# Classes
+# ===========================
+class Deadline:
+    """
+    Time limit of a search, which remembers whether the search had to stop
+    before it was complete.
+
+    Attributes
+    ----------
+    deadline : float
+        `time.monotonic()` value at which the search must stop, None for
+        no limit.
+    reached : bool
+        Whether the search stopped at the deadline.
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.reached = False
+
+    def check(self):
+        """ Returns True, and remembers it, once the deadline has passed. """
+        if not self.reached and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.reached = True
+        return self.reached
+
+
+class PreparedChord:
+    """
+    Fret positions of a chord with the rules terms which only depend on the
+    frets, computed once and shared by all the fingerings of the chord.
+
+    Attributes
+    ----------
+    frets : tuple
+        Fret numbers of the strings, MUTED for the muted ones (see utils.shapes).
+    fret_positions : list
+        Fret positions as strings, which the fingerings keep on their open
+        and muted strings.
+    fingered_frets : list
+        Strings that need a finger (neither muted nor open).
+    frets_used : set
+        Fret numbers of the fingered strings.
+    fret_first, fret_last : int
+        Lowest and highest fingered fret numbers (0 when all strings are open),
+        valid for the fingerings without thumb.
+    n_fretted : int
+        Number of strings counted as fretted by R8.
+    triples : list
+        Highest string of each three adjacent strings fretted alike (R21).
+    """
+
+    def __init__(self, fret_positions):
+        frets = parse_frets(fret_positions)
+        self.frets = frets
+        self.fret_positions = format_frets(frets)
+        self.fingered_frets = [i for i, ft in enumerate(frets) if ft > 0]
+        self.frets_used = set([frets[i] for i in self.fingered_frets])
+        self.fret_first = min(self.frets_used) if self.frets_used else 0
+        self.fret_last = max(self.frets_used) if self.frets_used else 0
+        self.n_fretted = len(self.fingered_frets)
+        self.triples = [i for i in range(2, 6)
+                        if frets[i] == frets[i-1] == frets[i-2] and frets[i] > 0]
+        self._muted_cost = None
+        self._shape_cost = None
+
+    @property
+    def muted_cost(self):
+        """ Cost of the muted strings surrounded by played ones (R12). """
+        if self._muted_cost is None:
+            self._muted_cost = int(muted_model_func(self.frets)/10)
+        return self._muted_cost
+
+    @property
+    def shape_cost(self):
+        """ Cost of the complexity of the shape (R25). """
+        if self._shape_cost is None:
+            self._shape_cost = int(fret_model_func(self.frets)/10)
+        return self._shape_cost
+
+
+class BestFingerings:
+    """
+    The k best fingerings met by a search, kept sorted while the search
+    goes: the cheapest ones, the first one in lexicographic order among
+    equal costs (the first one `search_exhaustive` meets), each fingering
+    once. The cost of the k-th one bounds the search.
+
+    Attributes
+    ----------
+    k : int
+        Number of fingerings kept.
+    ranking : list
+        (cost, fingering) of the fingerings kept, the best one first.
+    """
+
+    def __init__(self, k=1):
+        self.k = k
+        self.ranking = []
+
+    @property
+    def cost(self):
+        """ Cost of the best fingering, infinite before the first one. """
+        return self.ranking[0][0] if self.ranking else np.inf
+
+    @property
+    def bound(self):
+        """ Cost above which a fingering cannot enter the ranking. """
+        return self.ranking[-1][0] if len(self.ranking) == self.k else np.inf
+
+    def push(self, cost, fingering):
+        """ Keep a fingering if it is among the k best ones met so far. """
+        entry = (cost, fingering)
+        i = bisect.bisect_left(self.ranking, entry)
+        if i == self.k or (i < len(self.ranking) and self.ranking[i] == entry):
+            return
+        self.ranking.insert(i, entry)
+        del self.ranking[self.k:]
+
+
+class RuleStatistics:
+    """
+    Counters of the `compute_cost` calls: how many stopped before the last
+    rule because the cost exceeded the best cost (pruned), and while
+    collecting (which times each rule), how often and how much each rule
+    contributed to the cost.
+
+    Attributes
+    ----------
+    calls : int
+        Number of costs computed.
+    pruned : int
+        Number of costs whose computation stopped early.
+    skipped : int
+        Number of rule evaluations saved by stopping early.
+    collect : bool
+        Whether the contribution of each rule is recorded.
+    evaluations : dict
+        Number of times each rule was evaluated while collecting.
+    hits : dict
+        Number of times each rule added a cost while collecting.
+    totals : dict
+        Total cost added by each rule while collecting.
+    durations : dict
+        Total time spent evaluating each rule while collecting, in seconds.
+    """
+
+    def __init__(self):
+        self.collect = False
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.pruned = 0
+        self.skipped = 0
+        self.evaluations = dict([(R, 0) for R in utilities.rule_names])
+        self.hits = dict([(R, 0) for R in utilities.rule_names])
+        self.totals = dict([(R, 0) for R in utilities.rule_names])
+        self.durations = dict([(R, 0.) for R in utilities.rule_names])
+
+    def record(self, rule, rule_cost, duration=0.):
+        self.evaluations[rule] += 1
+        self.durations[rule] += duration
+        if rule_cost:
+            self.hits[rule] += 1
+            self.totals[rule] += rule_cost
+
+    def mean_cost(self, rule):
+        """ Average cost added by a rule when evaluated, 0 if never evaluated. """
+        if not self.evaluations[rule]:
+            return 0.
+        return self.totals[rule] / float(self.evaluations[rule])
+
+    def cost_rate(self, rule):
+        """ Cost added by a rule per second spent evaluating it, 0 if never evaluated. """
+        if not self.durations[rule]:
+            return 0.
+        return self.totals[rule] / self.durations[rule]
+
+    def prune_rate(self):
+        """ Share of the costs whose computation stopped early. """
+        return self.pruned / float(self.calls) if self.calls else 0.
+
+    def skip_rate(self):
+        """ Share of the rule evaluations saved by stopping early. """
+        return self.skipped / float(self.calls * len(rule_order)) if self.calls else 0.
+
+    def report(self):
+        """ Returns the counters as a dictionary. """
+        return {'calls': self.calls,
+                'pruned': self.pruned,
+                'prune_rate': self.prune_rate(),
+                'skipped': self.skipped,
+                'skip_rate': self.skip_rate(),
+                'rules': dict([(R, {'hit_rate': self.hits[R] / float(self.evaluations[R])
+                                                if self.evaluations[R] else 0.,
+                                    'mean_cost': self.mean_cost(R),
+                                    'cost_rate': self.cost_rate(R)})
+                               for R in utilities.rule_names])}
+
 
 
 # ===========================
 # Functions
 # ===========================
-def predict_fingering(fret_positions, strummable=True):
+def predict_fingering(fret_positions, strummable=True, engine=None, use_cache=True,
+                      deadline=None, return_search_complete=False):
     """
     Predict the fingering of a chord given its fret positions.
 
+    With a deadline the search stops when it is reached, and returns the
+    best fingering found so far (there is always one: the engines reach a
+    first fingering before checking the deadline). Only the tree searches
+    can stop early: the ranking of `search_vectorized` is computed at once,
+    and `search_cached` runs `search_branch_and_bound` instead of ranking a
+    shape missing from the cache.
+
+    Parameters
+    ----------
+    fret_positions : list
+        List of the fret positions on the strings (strings, integers or a
+        shape of utils.shapes).
+    strummable : bool
+        Whether the chord is meant to be strummed (see rule R28).
+    engine : str
+        Search engine to use, one of the keys of `search_engines`. A given
+        engine always runs, without the cache.
+    use_cache : bool
+        Without an engine, reuse the fingerings ranked for the same shape at
+        another position on the neck (see `search_cached`) if True, run
+        `search_branch_and_bound` otherwise.
+    deadline : float
+        `time.monotonic()` value at which the search must stop.
+    return_search_complete : bool
+        Return whether the search completed before the deadline if True.
+
+    Returns
+    -------
+    best_fingering : list
+        List of the finger positions matching best the chord.
+    best_cost : int
+        Cost of the best fingering for the chord.
+  ( search_complete : bool
+        Whether the fingering is the best one, the search being complete. )
+    """
+
+    search = _search_engine(engine, use_cache)
+    limit = Deadline(deadline) if deadline is not None else None
+    best_fingering, best_cost = search(fret_positions, strummable=strummable, deadline=limit)
+    if return_search_complete:
+        return best_fingering, best_cost, limit is None or not limit.reached
+    return best_fingering, best_cost
+
+
+def predict_fingerings(fret_positions, k=3, strummable=True, engine=None,
+                       use_cache=True, deadline=None, return_search_complete=False,
+                       return_rules_str=False):
+    """
+    Predict the k best fingerings of a chord given its fret positions, in
+    a single search keeping the best fingerings met (see `BestFingerings`)
+    instead of the best one only. The first one is the fingering of
+    `predict_fingering`.
+
+    Parameters
+    ----------
+    fret_positions : list
+        List of the fret positions on the strings (strings, integers or a
+        shape of utils.shapes).
+    k : int
+        Number of fingerings to predict.
+    strummable, engine, use_cache, deadline, return_search_complete
+        See `predict_fingering`.
+    return_rules_str : bool
+        Add the rules broken by each fingering (see `rules_dict_to_str`)
+        if True.
+
+    Returns
+    -------
+    fingerings : list
+        [fingering, cost] of the k best fingerings (all of them if the chord
+        has fewer), the best one first, followed by the rules broken if
+        return_rules_str is True.
+  ( search_complete : bool
+        Whether the fingerings are the best ones, the search being complete. )
+    """
+
+    search = _search_engine(engine, use_cache)
+    limit = Deadline(deadline) if deadline is not None else None
+    best = BestFingerings(k)
+    search(fret_positions, strummable=strummable, deadline=limit, best=best)
+    fingerings = []
+    for cost, fgr in best.ranking:
+        if return_rules_str:
+            _, rules_dict = compute_cost(fgr, fret_positions, return_rules_importance=True,
+                                         strummable=strummable)
+            fingerings.append([fgr, cost, rules_dict_to_str(rules_dict)[0]])
+        else:
+            fingerings.append([fgr, cost])
+    if return_search_complete:
+        return fingerings, limit is None or not limit.reached
+    return fingerings
+
+
+def _search_engine(engine, use_cache):
+    if engine is None:
+        return search_cached if use_cache else search_branch_and_bound
+    try:
+        return search_engines[engine]
+    except KeyError:
+        raise ValueError("Unknown search engine %r, expected one of %s"
+                         % (engine, ", ".join(sorted(search_engines))))
+
+
+
+def search_exhaustive(fret_positions, strummable=True, deadline=None, best=None):
+    """
+    Find the best fingering by computing the cost of every possible fingering,
+    starting from the cheapest `seed_fingerings` so that the early exit of
+    `compute_cost` applies from the first one.
+
     Parameters
     ----------
     fret_positions : list
-        List of the fret positions on the strings.
+        List of the fret positions on the strings (strings, integers or a
+        shape of utils.shapes).
+    strummable : bool
+        Whether the chord is meant to be strummed (see rule R28).
+    deadline : Deadline
+        Time limit of the search, if any.
+    best : BestFingerings
+        Ranking of the best fingerings met, to fill when more than the
+        best one is wanted.
 
     Returns
     -------
@@ -31,43 +358,493 @@ def predict_fingering(fret_positions, strummable=True):
     """
 
     ### get fret numbers where to put fingers
-    fingered_frets = [i for i, f in enumerate(fret_positions) if
-                      f.lower() != 'x' and f != '0']
+    chord = PreparedChord(fret_positions)
+    fret_positions = chord.fret_positions
+    fingered_frets = chord.fingered_frets
 
     ### generate all possible fingerings (without taking into account human playability)
     possible_fingerings = itertools.product(utilities.fingers,
                                             repeat=len(fingered_frets))
 
-    ### compute cost of each fingering and keep the best
-    best_cost = np.inf
-    best_fingering = None
+    ### compute cost of each fingering and keep the best (the first one among equals)
+    if best is None:
+        best = BestFingerings()
+    _push_seeds(chord, strummable, best)
     for fgr in possible_fingerings:
+        if deadline is not None and deadline.check():
+            break
         fgr = list(fgr)
         fgr = [fgr.pop(0) if i in fingered_frets else f for i, f in
                enumerate(fret_positions)]
-        current_cost = compute_cost(fgr, fret_positions, best_cost=best_cost,
-                                    strummable=strummable)
-        if current_cost < best_cost:
-            best_fingering = fgr
-            best_cost = current_cost
+        current_cost = compute_cost(fgr, fret_positions, best_cost=best.bound,
+                                    strummable=strummable, chord=chord)
+        best.push(current_cost, fgr)
 
     ### if the best fingering is still bad, take thumb into account
-    if best_cost > utilities.cost_threshold:
-        possible_fingerings = itertools.product(utilities.all_fingers, repeat=len(fingered_frets))
-        for fgr in possible_fingerings:
+    # (only on string E, and possibly on string A: the first pass covered the rest)
+    if best.cost > utilities.cost_threshold and 0 in fingered_frets:
+        choices = [['5'] if i == 0 else utilities.all_fingers if i == 1 else utilities.fingers
+                   for i in fingered_frets]
+        for fgr in itertools.product(*choices):
+            if deadline is not None and deadline.check():
+                break
             fgr = list(fgr)
             fgr = [fgr.pop(0) if i in fingered_frets else f for i,f in enumerate(fret_positions)]
-            if fgr[0] == '5' and '5' not in fgr[2:]: # only check for the 2 lowest-pitched strings
-                current_cost = compute_cost(fgr, fret_positions, best_cost=best_cost)
-                if current_cost < best_cost:
-                    best_fingering = fgr
-                    best_cost = current_cost
+            current_cost = compute_cost(fgr, fret_positions, best_cost=best.bound, chord=chord)
+            best.push(current_cost, fgr)
+
+    best_cost, best_fingering = best.ranking[0]
+    return best_fingering, best_cost
 
+
+
+def search_branch_and_bound(fret_positions, strummable=True, deadline=None, best=None):
+    """
+    Find the best fingering with a depth-first branch and bound search.
+
+    Fingers are assigned string by string, from the low-pitched E string
+    upwards, and a subtree is pruned as soon as `lower_bound_cost` of its
+    partial fingering exceeds the best cost found so far, starting from the
+    cost of the cheapest `seed_fingerings`. Only the fingerings breaking none
+    of the `utilities.hard_rules` are searched, unless none of them costs
+    less than `utilities.hard_rule_cost`. The fingers of each string are
+    tried from the most promising one (see `_promising_first`), so that
+    good fingerings are found early, and ties
+    are broken like in `search_exhaustive`, so both engines return the same
+    fingering and cost.
+
+    Parameters
+    ----------
+    fret_positions : list
+        List of the fret positions on the strings (strings, integers or a
+        shape of utils.shapes).
+    strummable : bool
+        Whether the chord is meant to be strummed (see rule R28).
+    deadline : Deadline
+        Time limit of the search, if any.
+    best : BestFingerings
+        Ranking of the best fingerings met, to fill when more than the
+        best one is wanted.
+
+    Returns
+    -------
+    best_fingering : list
+        List of the finger positions matching best the chord.
+    best_cost : int
+        Cost of the best fingering for the chord.
+    """
+
+    chord = PreparedChord(fret_positions)
+
+    ### search fingerings without the thumb
+    if best is None:
+        best = BestFingerings()
+    _push_seeds(chord, strummable, best)
+    choices = [_promising_first(utilities.fingers, chord, i) for i in chord.fingered_frets]
+    _branch(chord, choices, 0, strummable, best, deadline, hard_rules=utilities.hard_rules)
+    # the fingerings breaking a hard rule may be the best ones too
+    if best.bound >= utilities.hard_rule_cost:
+        _branch(chord, choices, 0, strummable, best, deadline)
+
+    ### if the best fingering is still bad, take thumb into account
+    if best.cost > utilities.cost_threshold:
+        _branch_thumb(chord, best, deadline)
+
+    best_cost, best_fingering = best.ranking[0]
     return best_fingering, best_cost
 
 
+def _branch_thumb(chord, best, deadline=None):
+    """
+    Search the fingerings with the thumb on string E (and possibly on
+    string A), updating `best` (a BestFingerings) in place.
+    """
+
+    if 0 in chord.fingered_frets:
+        choices = [['5'] if i == 0 else _promising_first(
+                       utilities.all_fingers if i == 1 else utilities.fingers, chord, i)
+                   for i in chord.fingered_frets]
+        bound_depth = len([i for i in chord.fingered_frets if i < 2])
+        _branch(chord, choices, bound_depth, True, best, deadline)
+
+
+def seed_fingerings(chord):
+    """
+    Quick guesses of good fingerings without thumb, to start the searches
+    with a tight bound.
+
+    Parameters
+    ----------
+    chord : PreparedChord
+        Chord to finger.
 
-def compute_cost(finger_positions, fret_positions, return_rules_importance=False, best_cost=np.inf, strummable=True):
+    Returns
+    -------
+    fingerings : list
+        One finger per fret from the lowest fret (the strings on the lowest
+        fret sharing finger 1 as a barre), and one finger per fret used,
+        the lowest fret first. Both use finger 4 beyond the fourth fret.
+    """
+
+    fret_positions = chord.fret_positions
+    frets_used = sorted(chord.frets_used)
+    fingerings = []
+    for finger_of in (lambda ft: ft - chord.fret_first + 1,
+                      lambda ft: frets_used.index(ft) + 1):
+        fgr = list(fret_positions)
+        for i in chord.fingered_frets:
+            fgr[i] = str(min(finger_of(chord.frets[i]), 4))
+        if fgr not in fingerings:
+            fingerings.append(fgr)
+    return fingerings
+
+
+def _push_seeds(chord, strummable, best):
+    """ Rank the `seed_fingerings` in best (a BestFingerings). """
+
+    for fgr in seed_fingerings(chord):
+        current_cost = compute_cost(fgr, chord.fret_positions, best_cost=best.bound,
+                                    strummable=strummable, chord=chord)
+        best.push(current_cost, fgr)
+
+
+def _promising_first(fingers, chord, string):
+    """
+    Order the fingers tried on a string by their distance to the finger of
+    the one finger per fret position starting from the lowest fret.
+    """
+
+    guess = min(chord.frets[string] - chord.fret_first + 1, 4)
+    return sorted(fingers, key=lambda fg: abs(int(fg) - guess))
+
+
+def _breaks_hard_rules(chord, fgr, string, hard_rules):
+    """
+    Check whether the finger just put on a string breaks one of hard_rules
+    (see `utilities.hard_rules`) with the fingers of the strings under it:
+    one finger on different frets (R5), fingers in the reverse order of
+    their frets (R2), a barre over an open string (R1) or over a lower
+    fret (R6).
+    """
+
+    fg = fgr[string]
+    frets = chord.frets
+    ft = frets[string]
+    lowest = None
+    for i in chord.fingered_frets:
+        if i >= string:
+            break
+        if fgr[i] == fg:
+            if 'R5' in hard_rules and frets[i] != ft:
+                return True
+            if lowest is None:
+                lowest = i
+        elif 'R2' in hard_rules and fgr[i] != '5' and fg != '5' and (
+                (fgr[i] < fg and frets[i] > ft) or (fgr[i] > fg and frets[i] < ft)):
+            return True
+    if lowest is not None and fg != '5':
+        for i in range(lowest + 1, string):
+            if 'R1' in hard_rules and frets[i] == 0:
+                return True
+            if 'R6' in hard_rules and fgr[i] != fg and 0 < frets[i] <= frets[lowest]:
+                return True
+    return False
+
+
+def _branch(chord, choices, bound_depth, strummable, best, deadline=None, hard_rules=()):
+    """
+    Walk the fingering tree and update `best` (a BestFingerings) in place.
+
+    `choices[d]` lists the fingers tried on the d-th fingered string, in the
+    order they are tried, and the lower bound is only used once `bound_depth`
+    strings have a finger (the strings which may hold the thumb must be
+    decided for the bound to hold). Among fingerings of equal cost, the first
+    one in lexicographic order is kept (the first one `search_exhaustive`
+    meets), whatever the order of the choices. The walk stops at the deadline,
+    as soon as `best` holds a fingering. The fingerings breaking one of
+    hard_rules (see `_breaks_hard_rules`) are skipped.
+    """
+
+    hard_rules = set(hard_rules) & set(utilities.rule_names)
+
+    fret_positions = chord.fret_positions
+    fingered_frets = chord.fingered_frets
+    fgr = [None if i in fingered_frets else f for i, f in enumerate(fret_positions)]
+    n_fingered = len(fingered_frets)
+
+    def visit(depth):
+        if depth == n_fingered:
+            leaf = list(fgr)
+            current_cost = compute_cost(leaf, fret_positions, best_cost=best.bound,
+                                        strummable=strummable, chord=chord)
+            best.push(current_cost, leaf)
+            return
+        string = fingered_frets[depth]
+        for fg in choices[depth]:
+            if deadline is not None and best.ranking and deadline.check():
+                break
+            fgr[string] = fg
+            if hard_rules and _breaks_hard_rules(chord, fgr, string, hard_rules):
+                continue
+            if depth + 1 >= bound_depth and lower_bound_cost(
+                    fgr, fret_positions, best_cost=best.bound, strummable=strummable,
+                    chord=chord) > best.bound:
+                continue
+            visit(depth + 1)
+        fgr[string] = None
+
+    visit(0)
+
+
+def search_vectorized(fret_positions, strummable=True, deadline=None, best=None):
+    """
+    Find the best fingering by computing the cost of every possible fingering
+    at once with the array rules of `fingering_vectorized`.
+
+    Parameters
+    ----------
+    fret_positions : list
+        List of the fret positions on the strings (strings, integers or a
+        shape of utils.shapes).
+    strummable : bool
+        Whether the chord is meant to be strummed (see rule R28).
+    deadline : Deadline
+        Time limit of the search, if any.
+    best : BestFingerings
+        Ranking of the best fingerings met, to fill when more than the
+        best one is wanted.
+
+    Returns
+    -------
+    best_fingering : list
+        List of the finger positions matching best the chord.
+    best_cost : int
+        Cost of the best fingering for the chord.
+    """
+
+    frets = fingering_vectorized.encode_frets(fret_positions)
+
+    ### compute cost of each fingering and keep the first best one
+    if best is None:
+        best = BestFingerings()
+    fingerings = fingering_vectorized.candidate_fingerings(frets)
+    costs, has_float_cost = fingering_vectorized.compute_costs(
+        fingerings, frets, strummable=strummable)
+    _push_costed(best, fingerings, costs, has_float_cost)
+
+    ### if the best fingering is still bad, take thumb into account
+    if best.cost > utilities.cost_threshold:
+        fingerings = fingering_vectorized.candidate_fingerings(frets, thumb=True)
+        if len(fingerings):
+            costs, has_float_cost = fingering_vectorized.compute_costs(
+                fingerings, frets)
+            _push_costed(best, fingerings, costs, has_float_cost)
+
+    best_cost, best_fingering = best.ranking[0]
+    return best_fingering, best_cost
+
+
+def _push_costed(best, fingerings, costs, has_float_cost):
+    """
+    Rank in best (a BestFingerings) the cheapest of the fingerings costed
+    by `fingering_vectorized.compute_costs`.
+    """
+
+    # a stable sort keeps the candidates order, which is the lexicographic one
+    for i in np.argsort(costs, kind='mergesort')[:best.k]:
+        cost = float(costs[i]) if has_float_cost[i] else int(costs[i])
+        best.push(cost, fingering_vectorized.decode_fingering(fingerings[i]))
+
+
+def search_cached(fret_positions, strummable=True, deadline=None, best=None):
+    """
+    Find the best fingering from the ranking cached for the shape of the chord.
+
+    Apart from R15 (squared last fret) and R20 (gaps weighted by
+    40 - fret), the rules only depend on fret differences and on the
+    position bands of `transposition_key`, so a movable shape played at
+    another fret keeps the same cost without these two rules. The cache
+    stores the best fingerings ranked by this relative cost, and only the
+    head of the ranking is costed again at the actual frets.
+
+    Ranking a shape missing from the cache costs every fingering at once,
+    so with a deadline such a shape is searched by `search_branch_and_bound`
+    instead (and not cached).
+
+    Parameters
+    ----------
+    fret_positions : list
+        List of the fret positions on the strings (strings, integers or a
+        shape of utils.shapes).
+    strummable : bool
+        Whether the chord is meant to be strummed (see rule R28).
+    deadline : Deadline
+        Time limit of the search, if any.
+    best : BestFingerings
+        Ranking of the best fingerings met, to fill when more than the
+        best one is wanted.
+
+    Returns
+    -------
+    best_fingering : list
+        List of the finger positions matching best the chord.
+    best_cost : int
+        Cost of the best fingering for the chord.
+    """
+
+    chord = PreparedChord(fret_positions)
+    absolute_cost = chord.fret_last**2 if 'R15' in utilities.rule_names else 0
+
+    if best is None:
+        best = BestFingerings()
+    key = transposition_key(chord.frets, strummable)
+    ranking = fingering_cache.get(key)
+    if ranking is None or not _best_of_ranking(ranking, chord, absolute_cost, strummable, best):
+        if deadline is not None:
+            return search_branch_and_bound(chord.frets, strummable, deadline, best)
+        ranking = _rank_fingerings(chord.frets, strummable, best)
+        fingering_cache.put(key, ranking)
+
+    ### if the best fingering is still bad, take thumb into account
+    if best.cost > utilities.cost_threshold:
+        _branch_thumb(chord, best, deadline)
+
+    best_cost, best_fingering = best.ranking[0]
+    return best_fingering, best_cost
+
+
+def transposition_key(fret_positions, strummable=True):
+    """
+    Key of a shape which does not change when the shape moves along the neck
+    as long as the costs of the fingerings only change by their R15 and R20
+    terms: the packed frets relative to the lowest one, the finger span
+    allowed at the lowest fret (R3, R13) and which frets of three adjacent
+    strings fretted alike are above fret 9 (R21).
+    """
+
+    frets = parse_frets(fret_positions)
+    frets_used = [ft for ft in frets if ft > 0]
+    if not frets_used:
+        return pack_frets(frets), 0, (), strummable
+    fret_first = min(frets_used)
+    shape = tuple([ft - fret_first + 1 if ft > 0 else ft for ft in frets])
+    high_frets = tuple(sorted(set(shape[i] for i in range(2, 6)
+                                  if frets[i-2] == frets[i-1] == frets[i] and frets[i] > 9)))
+    return pack_frets(shape), utilities.finger_span[fret_first], high_frets, strummable
+
+
+def _rank_fingerings(fret_positions, strummable, best):
+    """
+    Rank the fingerings without thumb of a chord by their cost without the
+    position dependent terms, and return the head of the ranking, the best
+    fingerings at the actual frets being ranked in best (a BestFingerings).
+    """
+
+    frets = fingering_vectorized.encode_frets(fret_positions)
+    fingerings = fingering_vectorized.candidate_fingerings(frets)
+    costs, has_float_cost, rules = fingering_vectorized.compute_costs(
+        fingerings, frets, return_rules_importance=True, strummable=strummable)
+    _push_costed(best, fingerings, costs, has_float_cost)
+
+    relative_costs = costs - rules.get('R20', 0)
+    if 'R15' in utilities.rule_names:
+        relative_costs -= frets.max()**2 if (frets > 0).any() else 0
+    order = np.argsort(relative_costs, kind='mergesort')
+    # keep the candidates order to break ties like the search engines
+    ranking = [(relative_costs[i], int(i), fingering_vectorized.decode_fingering(fingerings[i]))
+               for i in order[:ranking_size]]
+    complete = len(order) <= ranking_size
+    return ranking, complete
+
+
+def _best_of_ranking(ranking, chord, absolute_cost, strummable, best):
+    """
+    Cost the ranked fingerings at the actual frets until the relative cost
+    alone rules out the next ones, and rank the best ones in best (a
+    BestFingerings). Returns False, leaving best unchanged, when the cached
+    head of the ranking is too short to be sure of the best fingerings.
+    """
+
+    ranking, complete = ranking
+    found = BestFingerings(best.k)
+    for relative_cost, _, fgr in ranking:
+        if relative_cost + absolute_cost > found.bound:
+            break
+        current_cost = compute_cost(list(fgr), chord.fret_positions, best_cost=found.bound,
+                                    strummable=strummable, chord=chord)
+        found.push(current_cost, list(fgr))
+    else:
+        if not complete:
+            return False
+    for current_cost, fgr in found.ranking:
+        best.push(current_cost, fgr)
+    return True
+
+
+# fingerings kept for each shape in the transposition cache
+ranking_size = 64
+fingering_cache = LRUCache(maxsize=4096)
+
+
+search_engines = {'exhaustive': search_exhaustive,
+                  'branch_and_bound': search_branch_and_bound,
+                  'vectorized': search_vectorized}
+
+
+# order in which `compute_cost` evaluates the rules (see `reorder_rules`):
+# the sooner the costly rules come, the sooner it stops on bad fingerings.
+# A learned order depends on the timings of the machine, so it is only set
+# explicitly, never at import
+rule_order = list(utilities.rule_names)
+rule_statistics = RuleStatistics()
+
+
+def reorder_rules(statistics=None):
+    """
+    Evaluate first the rules adding the most cost per time spent evaluating
+    them, as recorded by the statistics (`rule_statistics` by default) while
+    collecting. The costs do not change, only how soon `compute_cost` stops
+    on fingerings worse than the best one.
+
+    Returns
+    -------
+    order : list
+        New order of the rules.
+    """
+
+    if statistics is None:
+        statistics = rule_statistics
+    rule_order[:] = sorted(utilities.rule_names, key=lambda R: -statistics.cost_rate(R))
+    return list(rule_order)
+
+
+def learn_rule_order(shapes, strummable=True, engine='branch_and_bound'):
+    """
+    Collect the contributions of the rules while predicting the fingerings
+    of a corpus of shapes, then reorder the rules (see `reorder_rules`).
+    The rules are evaluated in their default order while collecting.
+
+    Returns
+    -------
+    order : list
+        New order of the rules.
+    """
+
+    statistics = RuleStatistics()
+    statistics.collect = True
+    global rule_statistics
+    previous, rule_statistics = rule_statistics, statistics
+    rule_order[:] = utilities.rule_names
+    try:
+        for fret_positions in shapes:
+            predict_fingering(fret_positions, strummable, engine=engine, use_cache=False)
+    finally:
+        rule_statistics = previous
+    return reorder_rules(statistics)
+
+
+
+def compute_cost(finger_positions, fret_positions, return_rules_importance=False, best_cost=np.inf, strummable=True, chord=None):
     """
     Compute the cost of a given fingering.
     The lower the cost is, the better the fingering is.
@@ -80,6 +857,9 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
         List of the fret positions.
     return_rules_importance : bool
         Return rules importance if True.
+    chord : PreparedChord
+        Fret positions prepared beforehand, to share the rules terms which
+        do not depend on the fingering between the fingerings of a chord.
 
     Returns
     -------
@@ -99,8 +879,16 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
         pos_dict.setdefault(fg,[]).append(i)
     # store finger unique numbers (without open strings)
     fingers_used = set([int(fg) for fg in finger_positions if fg!='0' and fg.lower()!='x'])
-    # store fret unique numbers (without open strings)
-    frets_used = set([int(ft) for i,ft in enumerate(fret_positions) if ft!='0' and ft.lower()!='x' and finger_positions[i] != '5'])
+    if chord is None:
+        chord = PreparedChord(fret_positions)
+    frets = chord.frets
+    # store fret unique numbers (without open strings nor thumb)
+    if '5' in pos_dict:
+        frets_used = set([frets[i] for i in chord.fingered_frets if finger_positions[i] != '5'])
+        fret_first = min(frets_used) if frets_used else 0
+        fret_last = max(frets_used) if frets_used else 0
+    else:
+        frets_used, fret_first, fret_last = chord.frets_used, chord.fret_first, chord.fret_last
 
     ### Initialize cost to be increased when rules are not well-followed
     cost = 0
@@ -111,11 +899,18 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
 
 
     ################################## Rules ##################################
-    for R in utilities.rule_names:
+    stats = rule_statistics
+    stats.calls += 1
+    collect = stats.collect
+    for i_rule, R in enumerate(rule_order):
 
         # break loop as soon as cost is too large
         if cost > best_cost:
+            stats.pruned += 1
+            stats.skipped += len(rule_order) - i_rule
             break
+        if collect:
+            cost_before, time_before = cost, time.perf_counter()
 
         if R == 'R1':
             ### R1: An open string cannot be surrounded with the same finger
@@ -154,10 +949,10 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                                         if p1 > p2: # R2bis
                                             cost += Rc1
                                             if return_rules_importance: rules_dict['R2bis'] += Rc1
-                                        if int(fret_positions[p1]) > int(fret_positions[p2]): # R2
+                                        if frets[p1] > frets[p2]: # R2
                                             cost += Rc2
                                             if return_rules_importance: rules_dict['R2'] += Rc2
-                                        elif fret_positions[p1] == fret_positions[p2]: # R2ter
+                                        elif frets[p1] == frets[p2]: # R2ter
                                             Rc3 = (max(pos1)-min(pos1)+1)**4 * (max(pos_dict[fg2])-min(pos_dict[fg2])+1)**4 * (int(fg2) - int(fg1))
                                             cost += Rc3
                                             if return_rules_importance: rules_dict['R2ter'] += Rc3
@@ -169,9 +964,8 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             ### R3: The span between Finger 1 and Finger 4 must be 5 or less when on the first
             # 4 frets, 6 or less when on 5-15 frets, and 7 or less when on 16-24 frets.
             Rc1 = 100000
-            try:
-                fret_first = min(frets_used)
-                fret_last = max(frets_used)
+            # nothing to check when all played frets are open
+            if frets_used:
                 if fret_last - fret_first > utilities.finger_span[fret_first]:
                     cost += Rc1
                     if return_rules_importance: rules_dict['R3'] += Rc1
@@ -179,11 +973,6 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                     Rc2 = utilities.finger_span_cost[fret_last - fret_first]
                     cost += Rc2
                     if return_rules_importance: rules_dict['R3'] += Rc2
-            except ValueError:
-                # all played frets are open
-                fret_first = 0
-                fret_last = 0
-                pass
 
         elif R == 'R4':
             ### R4: Finger 1 is often used for barre chords, so can cover anywhere
@@ -210,7 +999,7 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             ### R5: One finger cannot barre different fret numbers.
             Rc = 100000
             for fg in fingers_used:
-                if len(set([fret_positions[p] for p in pos_dict[str(fg)]])) > 1:
+                if len(set([frets[p] for p in pos_dict[str(fg)]])) > 1:
                     cost += Rc
                     if return_rules_importance: rules_dict['R5'] += Rc
 
@@ -221,9 +1010,9 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             Rc2 = 500
             for fg in fingers_used:
                 if len(pos_dict[str(fg)]) > 1:
-                    for i,ft in enumerate(fret_positions):
-                        if i not in pos_dict[str(fg)] and ft.lower()!='x' and ft!='0':
-                            if int(ft) <= int(fret_positions[min(pos_dict[str(fg)])]):
+                    for i,ft in enumerate(frets):
+                        if i not in pos_dict[str(fg)] and ft > 0:
+                            if ft <= frets[min(pos_dict[str(fg)])]:
                                 if i > min(pos_dict[str(fg)]) and i < max(pos_dict[str(fg)]):
                                     cost += Rc1
                                     if return_rules_importance: rules_dict['R6'] += Rc1
@@ -244,7 +1033,7 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             for fg in fingers_used:
                 if fg != 5:
                     for p in pos_dict[str(fg)]:
-                        Rc = ( ( (int(fret_positions[p]) - fret_first) - (fg - 1) )**2 ) *150
+                        Rc = ( ( (frets[p] - fret_first) - (fg - 1) )**2 ) *150
                         cost += Rc
                         if return_rules_importance: rules_dict['R7'] += Rc
             """
@@ -252,29 +1041,29 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                 if fg != 5:
                     for p in pos_dict[str(fg)]:
                         if fg == 1 or fg == 2:
-                            Rc = ( ( (int(fret_positions[p]) - fret_first) - (fg - 1) )**2 ) *150
+                            Rc = ( ( (frets[p] - fret_first) - (fg - 1) )**2 ) *150
                             cost += Rc
                             if return_rules_importance: rules_dict['R7'] += Rc
                         elif fg == 3:
                             if '2' not in pos_dict:
-                                Rc = ( ( (int(fret_positions[p]) - fret_first) - (fg - 1) )**2 ) *150
+                                Rc = ( ( (frets[p] - fret_first) - (fg - 1) )**2 ) *150
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R7'] += Rc
                             else:
-                                Rc = ( ( (int(fret_positions[p]) - int(fret_positions[pos_dict['2'][0]])) - (fg - 2) )**2 ) *150
+                                Rc = ( ( (frets[p] - frets[pos_dict['2'][0]]) - (fg - 2) )**2 ) *150
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R7'] += Rc
                         elif fg == 4:
                             if '2' not in pos_dict and '3' not in pos_dict:
-                                Rc = ( ( (int(fret_positions[p]) - fret_first) - (fg - 1) )**2 ) *150
+                                Rc = ( ( (frets[p] - fret_first) - (fg - 1) )**2 ) *150
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R7'] += Rc
                             elif '3' in pos_dict:
-                                Rc = ( ( (int(fret_positions[p]) - int(fret_positions[pos_dict['3'][0]])) - (fg - 3) )**2 ) *150
+                                Rc = ( ( (frets[p] - frets[pos_dict['3'][0]]) - (fg - 3) )**2 ) *150
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R7'] += Rc
                             else:
-                                Rc = ( ( (int(fret_positions[p]) - int(fret_positions[pos_dict['2'][0]])) - (fg - 2) )**2 ) *150
+                                Rc = ( ( (frets[p] - frets[pos_dict['2'][0]]) - (fg - 2) )**2 ) *150
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R7'] += Rc
             """
@@ -284,7 +1073,7 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             ### R8: If you have 3-4 different frets being used,
             # it's good to use one finger per fret
             Rc = 1000
-            if len([ft for ft in fret_positions if ft != '0' and ft != 'x']) <= 4:
+            if chord.n_fretted <= 4:
                 if len(fingers_used) < 4:
                     if any([len(pos_dict[str(fg)]) > 1 for fg in fingers_used if fg != 1 and fg != 5]):
                         cost += Rc
@@ -297,8 +1086,8 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             for fg in ['2','3']:
                 if fg in pos_dict:
                     if len(pos_dict[fg]) > 1 :
-                        for i,ft in enumerate(fret_positions):
-                            if i not in pos_dict[fg] and ft.lower()!='x' and ft!='0':
+                        for i,ft in enumerate(frets):
+                            if i not in pos_dict[fg] and ft > 0:
                                 if i < min(pos_dict[fg]) - 3 or i < max(pos_dict[fg]) - 4 and finger_positions[i] != '5':
                                     cost += Rc1
                                     if return_rules_importance: rules_dict['R9'] += Rc1
@@ -318,9 +1107,9 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             ### R11: It is hard for finger 3 and 4 to cover more than a 4-strings gap.
             Rc = 10000
             if '4' in pos_dict:
-                for i,ft in enumerate(fret_positions):
+                for i,ft in enumerate(frets):
                     if finger_positions[i] == '3':
-                        if i not in pos_dict['4'] and ft!='x' and ft!='0':
+                        if i not in pos_dict['4'] and ft > 0:
                             if i > min(pos_dict['4']) + 4:
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R11'] += Rc
@@ -336,7 +1125,7 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                             cost += Rc
                             if return_rules_importance: rules_dict['R12'] += Rc
             """
-            Rc = int(muted_model_func(fret_positions)/10)
+            Rc = chord.muted_cost
             cost += Rc
             if return_rules_importance: rules_dict['R12'] += Rc
 
@@ -346,15 +1135,15 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             for fg1 in fingers_used:
                 for fg2 in fingers_used:
                     if fg2-1 == fg1 and fg2 != 5:
-                        if ( int(fret_positions[pos_dict[str(fg2)][0]])
-                             - int(fret_positions[pos_dict[str(fg1)][0]]) ) \
+                        if ( frets[pos_dict[str(fg2)][0]]
+                             - frets[pos_dict[str(fg1)][0]] ) \
                              > utilities.finger_span[fret_first] - 3:
-                            Rc = (utilities.finger_span[fret_first] - 3)**2 * 100 * abs( int(fret_positions[pos_dict[str(fg2)][0]]) - int(fret_positions[pos_dict[str(fg1)][0]]) ) * 2
+                            Rc = (utilities.finger_span[fret_first] - 3)**2 * 100 * abs( frets[pos_dict[str(fg2)][0]] - frets[pos_dict[str(fg1)][0]] ) * 2
                             cost += Rc
                             if return_rules_importance: rules_dict['R13'] += Rc
                         if fg1 == 1:
-                            if int(fret_positions[pos_dict[str(fg2)][0]]) - int(fret_positions[pos_dict[str(fg1)][0]]) > 0:
-                                Rc = ( abs( int(fret_positions[pos_dict[str(fg2)][0]]) - int(fret_positions[pos_dict[str(fg1)][0]]) ) - 1 ) * 100
+                            if frets[pos_dict[str(fg2)][0]] - frets[pos_dict[str(fg1)][0]] > 0:
+                                Rc = ( abs( frets[pos_dict[str(fg2)][0]] - frets[pos_dict[str(fg1)][0]] ) - 1 ) * 100
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R13'] +=  Rc
 
@@ -388,12 +1177,12 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             if '4' in pos_dict and '1' in pos_dict:
                 for fg in ['2','3']:
                     if fg in pos_dict:
-                        if abs(int(fret_positions[pos_dict['1'][0]]) - int(fret_positions[pos_dict[fg][0]])) > 2:
+                        if abs(frets[pos_dict['1'][0]] - frets[pos_dict[fg][0]]) > 2:
                             if min(pos_dict['4']) < max(pos_dict[fg]):
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R16'] += Rc
             if '4' in pos_dict and '2' in pos_dict and '3' in pos_dict:
-                    if abs(int(fret_positions[pos_dict['2'][0]]) - int(fret_positions[pos_dict['3'][0]])) > 1:
+                    if abs(frets[pos_dict['2'][0]] - frets[pos_dict['3'][0]]) > 1:
                         if min(pos_dict['4']) < max(pos_dict['3']):
                             cost += Rc
                             if return_rules_importance: rules_dict['R16'] += Rc
@@ -439,24 +1228,24 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                     if len(fingers_used) > 1:
                         fg_max = str(max([fu for fu in fingers_used if fu != 5]))
                         for pos4 in pos_dict[fg_max]:
-                            if int(fret_positions[pos5]) > int(fret_positions[pos4]):
+                            if frets[pos5] > frets[pos4]:
                                 cost += Rc1
                                 if return_rules_importance: rules_dict['R19'] += Rc1
-                            elif int(fret_positions[pos5]) == int(fret_positions[pos4]):
+                            elif frets[pos5] == frets[pos4]:
                                 cost += Rc2
                                 if return_rules_importance: rules_dict['R19'] += Rc2
-                            elif int(fret_positions[pos5]) < int(fret_positions[pos4]) - 4:
+                            elif frets[pos5] < frets[pos4] - 4:
                                 cost += Rc1
                                 if return_rules_importance: rules_dict['R19'] += Rc1
-                            elif int(fret_positions[pos5]) < int(fret_positions[pos4]) - 3:
+                            elif frets[pos5] < frets[pos4] - 3:
                                 cost += Rc2
                                 if return_rules_importance: rules_dict['R19'] += Rc2
                     pos_min = pos_dict[str(min(fingers_used))][0]
-                    if int(fret_positions[pos5]) < int(fret_positions[pos_min]) - 2:
+                    if frets[pos5] < frets[pos_min] - 2:
                         cost += Rc1
                         if return_rules_importance: rules_dict['R19'] += Rc1
-                    if int(fret_positions[pos_min]) < int(fret_positions[pos5]):
-                        Rc3 = ( int(fret_positions[pos5]) - int(fret_positions[pos_min]) )**3 * 1000
+                    if frets[pos_min] < frets[pos5]:
+                        Rc3 = ( frets[pos5] - frets[pos_min] )**3 * 1000
                         cost += Rc3
                         if return_rules_importance: rules_dict['R19'] += Rc3
 
@@ -479,33 +1268,33 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                         pos1 = pos_dict[str(fg1)][0]
                         pos2 = pos_dict[str(fg2)][0]
                         if fg1 == 1:
-                            Rc = int( ( 40 - int(fret_positions[pos1]) ) * abs( int(fret_positions[pos2]) - int(fret_positions[pos1]) - 1 ) * 1 * coef )
+                            Rc = int( ( 40 - frets[pos1] ) * abs( frets[pos2] - frets[pos1] - 1 ) * 1 * coef )
                             cost += Rc
                             if return_rules_importance: rules_dict['R20'] += Rc
                         elif fg1 == 2:
-                            Rc = int( ( 40 - int(fret_positions[pos1]) ) * abs( int(fret_positions[pos2]) - int(fret_positions[pos1]) - 1 ) * 1.5 * coef )
+                            Rc = int( ( 40 - frets[pos1] ) * abs( frets[pos2] - frets[pos1] - 1 ) * 1.5 * coef )
                             cost += Rc
                             if return_rules_importance: rules_dict['R20'] += Rc
                         elif fg1 == 3:
-                            Rc = int( ( 40 - int(fret_positions[pos1]) ) * abs( int(fret_positions[pos2]) - int(fret_positions[pos1]) - 1 ) * 1.3 * coef )
+                            Rc = int( ( 40 - frets[pos1] ) * abs( frets[pos2] - frets[pos1] - 1 ) * 1.3 * coef )
                             cost += Rc
                             if return_rules_importance: rules_dict['R20'] += Rc
                     if fg2-2 == fg1:
                         pos1 = pos_dict[str(fg1)][0]
                         pos2 = pos_dict[str(fg2)][0]
                         if fg1 == 1:
-                            Rc = int( ( 40 - int(fret_positions[pos1]) ) * abs( int(fret_positions[pos2]) - int(fret_positions[pos1]) - 2 ) * 1 * coef * 0.5 )
+                            Rc = int( ( 40 - frets[pos1] ) * abs( frets[pos2] - frets[pos1] - 2 ) * 1 * coef * 0.5 )
                             cost += Rc
                             if return_rules_importance: rules_dict['R20'] += Rc
                         elif fg1 == 2:
-                            Rc = int( ( 40 - int(fret_positions[pos1]) ) * abs( int(fret_positions[pos2]) - int(fret_positions[pos1]) - 2 ) * 1 * coef * 0.5 )
+                            Rc = int( ( 40 - frets[pos1] ) * abs( frets[pos2] - frets[pos1] - 2 ) * 1 * coef * 0.5 )
                             cost += Rc
                             if return_rules_importance: rules_dict['R20'] += Rc
                     if fg2-3 == fg1:
                         pos1 = pos_dict[str(fg1)][0]
                         pos2 = pos_dict[str(fg2)][0]
                         if fg1 == 1:
-                            Rc = int( ( 40 - int(fret_positions[pos1]) ) * abs( int(fret_positions[pos2]) - int(fret_positions[pos1]) - 3 ) * 1 * coef * 0.25 )
+                            Rc = int( ( 40 - frets[pos1] ) * abs( frets[pos2] - frets[pos1] - 3 ) * 1 * coef * 0.25 )
                             cost += Rc
                             if return_rules_importance: rules_dict['R20'] += Rc
 
@@ -522,32 +1311,31 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             # highest string number (eg string 3) and the third lowest finger should
             # be on the lowest string number (eg string 2).
             Rc = 100
-            for i in range(2,6):
-                if fret_positions[i] == fret_positions[i-1] and fret_positions[i-2] == fret_positions[i-1] and fret_positions[i] != 'x' and fret_positions[i] != '0':
-                    if finger_positions[i] != finger_positions[i-1] and finger_positions[i] != finger_positions[i-2] and finger_positions[i-1] != finger_positions[i-2]:
-                        concerned_fingers = [int(finger_positions[i-2]), int(finger_positions[i-1]), int(finger_positions[i])]
-                        ordered_concerned_fingers = sorted(concerned_fingers)
-                        fg1, fg2, fg3 = ordered_concerned_fingers
-                        if int(fret_positions[i]) <= 9:
-                            if concerned_fingers[1] != fg1:
-                                cost += Rc
-                                if return_rules_importance: rules_dict['R21'] += Rc
-                            if concerned_fingers[0] != fg2:
-                                cost += Rc
-                                if return_rules_importance: rules_dict['R21'] += Rc
-                            if concerned_fingers[2] != fg3:
-                                cost += Rc
-                                if return_rules_importance: rules_dict['R21'] += Rc
-                        else:
-                            if concerned_fingers[2] != fg1:
-                                cost += Rc
-                                if return_rules_importance: rules_dict['R21'] += Rc
-                            if concerned_fingers[1] != fg2:
-                                cost += Rc
-                                if return_rules_importance: rules_dict['R21'] += Rc
-                            if concerned_fingers[0] != fg3:
-                                cost += Rc
-                                if return_rules_importance: rules_dict['R21'] += Rc
+            for i in chord.triples:
+                if finger_positions[i] != finger_positions[i-1] and finger_positions[i] != finger_positions[i-2] and finger_positions[i-1] != finger_positions[i-2]:
+                    concerned_fingers = [int(finger_positions[i-2]), int(finger_positions[i-1]), int(finger_positions[i])]
+                    ordered_concerned_fingers = sorted(concerned_fingers)
+                    fg1, fg2, fg3 = ordered_concerned_fingers
+                    if frets[i] <= 9:
+                        if concerned_fingers[1] != fg1:
+                            cost += Rc
+                            if return_rules_importance: rules_dict['R21'] += Rc
+                        if concerned_fingers[0] != fg2:
+                            cost += Rc
+                            if return_rules_importance: rules_dict['R21'] += Rc
+                        if concerned_fingers[2] != fg3:
+                            cost += Rc
+                            if return_rules_importance: rules_dict['R21'] += Rc
+                    else:
+                        if concerned_fingers[2] != fg1:
+                            cost += Rc
+                            if return_rules_importance: rules_dict['R21'] += Rc
+                        if concerned_fingers[1] != fg2:
+                            cost += Rc
+                            if return_rules_importance: rules_dict['R21'] += Rc
+                        if concerned_fingers[0] != fg3:
+                            cost += Rc
+                            if return_rules_importance: rules_dict['R21'] += Rc
 
         elif R == 'R22':
             ### R22: The rule is about using as few unique fingers as possible.
@@ -578,7 +1366,7 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             # larger than zero, then the finger cannot be zero, and the reverse
             # (as well as muted string or else).
             Rc = 500000
-            if len([0 for fgp, ftp in zip(finger_positions, fret_positions) if ( fgp != ftp and ( fgp == '0' or ftp == '0' or fgp == 'x' or ftp == 'x' ) )]) > 0:
+            if len([0 for fgp, ft in zip(finger_positions, frets) if ( (fgp == '0') != (ft == 0) or (fgp == 'x') != (ft == MUTED) )]) > 0:
                 cost += Rc
                 if return_rules_importance: rules_dict['R24'] += Rc
 
@@ -599,7 +1387,7 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             cost += Rc
             if return_rules_importance: rules_dict['R25'] += Rc
             """
-            Rc = int(fret_model_func(fret_positions)/10)
+            Rc = chord.shape_cost
             cost += Rc
             if return_rules_importance: rules_dict['R25'] += Rc
 
@@ -609,8 +1397,8 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             # more than halfway towards f4, then use f3, otherwise use f2.
             Rc = 100
             if '1' in fingers_used and '4' in fingers_used:
-                ft1 = fret_positions[pos_dict['1'][0]]
-                ft4 = fret_positions[pos_dict['4'][0]]
+                ft1 = frets[pos_dict['1'][0]]
+                ft4 = frets[pos_dict['4'][0]]
                 if ft1 != ft4:
                     if min(pos_dict['1']) < min(pos_dict['4']):
                         thres = 0.5001
@@ -618,11 +1406,11 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                         #thres = 0.4999
                         thres = 0.5001
                     if '3' in fingers_used and '2' not in fingers_used:
-                        ft3 = fret_positions[pos_dict['3'][0]]
+                        ft3 = frets[pos_dict['3'][0]]
                         if (ft3 - ft1)/float(ft4 - ft1) > thres:
                             Rc -= 50
                     elif '2' in fingers_used and '3' not in fingers_used:
-                        ft2 = fret_positions[pos_dict['2'][0]]
+                        ft2 = frets[pos_dict['2'][0]]
                         if (ft2 - ft1)/float(ft4 - ft1) < thres:
                             Rc -= 50
             cost += Rc
@@ -636,7 +1424,7 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                 if len(pos_dict[str(fg1)]) > 1:
                     for fg2 in fingers_used:
                         if int(fg2) > int(fg1):
-                            if fret_positions[pos_dict[str(fg1)][0]] == fret_positions[pos_dict[str(fg2)][0]] and pos_dict[str(fg2)][0] < pos_dict[str(fg1)][0]-1:
+                            if frets[pos_dict[str(fg1)][0]] == frets[pos_dict[str(fg2)][0]] and pos_dict[str(fg2)][0] < pos_dict[str(fg1)][0]-1:
                                 cost += Rc
                                 if return_rules_importance: rules_dict['R27'] += Rc
 
@@ -697,11 +1485,11 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
             Rc = 0
             if '5' in pos_dict:
                 if 1 in pos_dict['5']:
-                    if fret_positions[2] != '0' and fret_positions[2] != 'x':
+                    if frets[2] > 0:
                         cost += Rc
                         if return_rules_importance: rules_dict['R30'] += Rc
                 elif 0 in pos_dict['5']:
-                    if fret_positions[1] != '0' and fret_positions[1] != 'x':
+                    if frets[1] > 0:
                         cost += Rc
                         if return_rules_importance: rules_dict['R30'] += Rc
 
@@ -715,6 +1503,9 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
                     cost += Rc
                     if return_rules_importance: rules_dict['R31'] += Rc
 
+        if collect:
+            stats.record(R, cost - cost_before, time.perf_counter() - time_before)
+
 
     # Returns
     if return_rules_importance:
@@ -724,6 +1515,277 @@ def compute_cost(finger_positions, fret_positions, return_rules_importance=False
 
 
 
+def lower_bound_cost(finger_positions, fret_positions, best_cost=np.inf, strummable=True, chord=None):
+    """
+    Compute a lower bound of the cost of any fingering completing a partial one.
+
+    Fingers must be chosen string by string from the low-pitched E string and
+    the strings which may hold the thumb (E and A) must already be decided.
+    Only the rules whose cost cannot decrease when more strings get a finger
+    are computed, the other ones count as zero.
+
+    Parameters
+    ----------
+    finger_positions : list
+        List of the finger positions, None for the fretted strings that do
+        not have a finger yet.
+    fret_positions : list
+        List of the fret positions.
+    best_cost : float
+        Stop computing as soon as the bound exceeds this cost.
+    strummable : bool
+        Whether the chord is meant to be strummed (see rule R28).
+    chord : PreparedChord
+        Fret positions prepared beforehand (see `compute_cost`).
+
+    Returns
+    -------
+    cost : int
+        Lower bound of the cost of the completed fingerings.
+    """
+
+    ### Store finger positions of the fingered strings in a dictionary
+    pos_dict = {}
+    for i,fg in enumerate(finger_positions):
+        if fg is not None:
+            pos_dict.setdefault(fg,[]).append(i)
+    fingers_used = set([int(fg) for fg in finger_positions if fg is not None and fg!='0' and fg.lower()!='x'])
+    if chord is None:
+        chord = PreparedChord(fret_positions)
+    frets = chord.frets
+    # strings without a finger yet will not hold the thumb
+    if '5' in pos_dict:
+        frets_used = set([frets[i] for i in chord.fingered_frets if finger_positions[i] != '5'])
+    else:
+        frets_used = chord.frets_used
+    cost = 0
+
+    ### R1 and R1bis
+    if '0' in pos_dict:
+        for pos_0 in pos_dict['0']:
+            for fg in utilities.fingers:
+                if fg in pos_dict and len(pos_dict[fg]) > 1:
+                    if pos_0 < max(pos_dict[fg]) and pos_0 > min(pos_dict[fg]):
+                        cost += 100000
+                    if pos_0 > max(pos_dict[fg]):
+                        cost += 10000
+
+    ### R2, R2bis and R2ter
+    for fg1,pos1 in pos_dict.items():
+        if fg1 != 'x' and fg1 != '0' and fg1 != '5':
+            for p1 in pos1:
+                for fg2 in utilities.fingers:
+                    if fg2 in pos_dict:
+                        if int(fg1) < int(fg2):
+                            for p2 in pos_dict[fg2]:
+                                if p1 > p2:
+                                    cost += 100
+                                if frets[p1] > frets[p2]:
+                                    cost += 200000
+                                elif frets[p1] == frets[p2]:
+                                    cost += (max(pos1)-min(pos1)+1)**4 * (max(pos_dict[fg2])-min(pos_dict[fg2])+1)**4 * (int(fg2) - int(fg1))
+                                    if p1 > p2:
+                                        cost += 80
+    if cost >= best_cost:
+        return cost
+
+    ### R3
+    if frets_used:
+        fret_first = min(frets_used)
+        fret_last = max(frets_used)
+        if fret_last - fret_first > utilities.finger_span[fret_first]:
+            cost += 100000
+        else:
+            cost += utilities.finger_span_cost[fret_last - fret_first]
+    else:
+        fret_first = 0
+        fret_last = 0
+
+    ### R4 and R4bis
+    for fg in utilities.fingers:
+        if fg in pos_dict:
+            len_barre = max(pos_dict[fg])-min(pos_dict[fg])+1
+            cost += (len_barre**2+1)*int(fg)*5
+            if len_barre >= 3:
+                cost += (int(fg)-1)*20 * (len_barre-3)*20
+
+    ### R5
+    for fg in fingers_used:
+        if len(set([frets[p] for p in pos_dict[str(fg)]])) > 1:
+            cost += 100000
+    if cost >= best_cost:
+        return cost
+
+    ### R6 and R6bis (strings without a finger yet are skipped)
+    for fg in fingers_used:
+        if len(pos_dict[str(fg)]) > 1:
+            for i,ft in enumerate(frets):
+                if i not in pos_dict[str(fg)] and finger_positions[i] is not None and ft > 0:
+                    if ft <= frets[min(pos_dict[str(fg)])]:
+                        if i > min(pos_dict[str(fg)]) and i < max(pos_dict[str(fg)]):
+                            cost += 100000
+                        elif i > max(pos_dict[str(fg)]):
+                            if i > max(pos_dict[str(fg)]) + 1 and finger_positions[i-1] != 'x' and finger_positions[i-1] != '0':
+                                pass
+                            elif i > max(pos_dict[str(fg)]) + 2 and finger_positions[i-2] != 'x' and finger_positions[i-2] != '0':
+                                pass
+                            elif i > max(pos_dict[str(fg)]) + 3 and finger_positions[i-3] != 'x' and finger_positions[i-3] != '0':
+                                pass
+                            else:
+                                cost += 500
+
+    ### R7
+    for fg in fingers_used:
+        if fg != 5:
+            for p in pos_dict[str(fg)]:
+                cost += ( ( (frets[p] - fret_first) - (fg - 1) )**2 ) *150
+    if cost >= best_cost:
+        return cost
+
+    ### R9 (strings without a finger yet are skipped)
+    for fg in ['2','3']:
+        if fg in pos_dict:
+            if len(pos_dict[fg]) > 1 :
+                for i,ft in enumerate(frets):
+                    if i not in pos_dict[fg] and finger_positions[i] is not None and ft > 0:
+                        if i < min(pos_dict[fg]) - 3 or i < max(pos_dict[fg]) - 4 and finger_positions[i] != '5':
+                            cost += 10000
+                        elif i < min(pos_dict[fg]) - 2 or i < max(pos_dict[fg]) - 3 and finger_positions[i] != '5':
+                            cost += 2000
+
+    ### R10
+    if '1' in pos_dict and '2' in pos_dict:
+        if len(pos_dict['1']) > 1 and len(pos_dict['2']) > 1 :
+            cost += 5000
+
+    ### R11
+    if '4' in pos_dict:
+        for i,ft in enumerate(frets):
+            if finger_positions[i] == '3':
+                if i not in pos_dict['4'] and ft > 0:
+                    if i > min(pos_dict['4']) + 4:
+                        cost += 10000
+    if cost >= best_cost:
+        return cost
+
+    ### R13
+    for fg1 in fingers_used:
+        for fg2 in fingers_used:
+            if fg2-1 == fg1 and fg2 != 5:
+                gap = frets[pos_dict[str(fg2)][0]] - frets[pos_dict[str(fg1)][0]]
+                if gap > utilities.finger_span[fret_first] - 3:
+                    cost += (utilities.finger_span[fret_first] - 3)**2 * 100 * abs(gap) * 2
+                if fg1 == 1:
+                    if gap > 0:
+                        cost += ( abs(gap) - 1 ) * 100
+
+    ### R14
+    if '3' in pos_dict and '4' in pos_dict:
+        if max(pos_dict['3'])-min(pos_dict['3']) > 1 :
+            if min(pos_dict['4']) < max(pos_dict['3']):
+                cost += 10000
+
+    ### R15
+    cost += fret_last**2
+    if '4' in pos_dict and '1' in pos_dict:
+        if max(pos_dict['1'])-min(pos_dict['1']) == 5:
+            cost += (6-min(pos_dict['4']))**4 * 0.5
+
+    ### R16
+    if '4' in pos_dict and '1' in pos_dict:
+        for fg in ['2','3']:
+            if fg in pos_dict:
+                if abs(frets[pos_dict['1'][0]] - frets[pos_dict[fg][0]]) > 2:
+                    if min(pos_dict['4']) < max(pos_dict[fg]):
+                        cost += 4000
+    if '4' in pos_dict and '2' in pos_dict and '3' in pos_dict:
+        if abs(frets[pos_dict['2'][0]] - frets[pos_dict['3'][0]]) > 1:
+            if min(pos_dict['4']) < max(pos_dict['3']):
+                cost += 4000
+    if cost >= best_cost:
+        return cost
+
+    ### R18
+    if '5' in pos_dict:
+        if all( [ p5<3 for p5 in pos_dict['5'] ] ):
+            if 0 in pos_dict['5']:
+                if 2 in pos_dict['5'] and 1 not in pos_dict['5']:
+                    cost += 200000
+                else:
+                    cost += ( len(pos_dict['5'])**2 ) * 1000
+            else:
+                cost += 200000
+        else:
+            cost += 200000
+
+    ### R20
+    coef = 0.25
+    for fg1 in fingers_used:
+        for fg2 in fingers_used:
+            ft1 = frets[pos_dict[str(fg1)][0]]
+            ft2 = frets[pos_dict[str(fg2)][0]]
+            if fg2-1 == fg1:
+                if fg1 == 1:
+                    cost += int( ( 40 - ft1 ) * abs( ft2 - ft1 - 1 ) * 1 * coef )
+                elif fg1 == 2:
+                    cost += int( ( 40 - ft1 ) * abs( ft2 - ft1 - 1 ) * 1.5 * coef )
+                elif fg1 == 3:
+                    cost += int( ( 40 - ft1 ) * abs( ft2 - ft1 - 1 ) * 1.3 * coef )
+            if fg2-2 == fg1:
+                if fg1 == 1 or fg1 == 2:
+                    cost += int( ( 40 - ft1 ) * abs( ft2 - ft1 - 2 ) * 1 * coef * 0.5 )
+            if fg2-3 == fg1:
+                if fg1 == 1:
+                    cost += int( ( 40 - ft1 ) * abs( ft2 - ft1 - 3 ) * 1 * coef * 0.25 )
+
+    ### R21 (only for three strings which all have a finger)
+    for i in chord.triples:
+        concerned_fingers = finger_positions[i-2:i+1]
+        if None not in concerned_fingers and len(set(concerned_fingers)) == 3:
+            concerned_fingers = [int(fg) for fg in concerned_fingers]
+            fg1, fg2, fg3 = sorted(concerned_fingers)
+            if frets[i] <= 9:
+                cost += 100 * ((concerned_fingers[1] != fg1) + (concerned_fingers[0] != fg2) + (concerned_fingers[2] != fg3))
+            else:
+                cost += 100 * ((concerned_fingers[2] != fg1) + (concerned_fingers[1] != fg2) + (concerned_fingers[0] != fg3))
+
+    ### R22
+    cost += sum( [4*fg for fg in fingers_used] )
+
+    ### R23
+    Rc = 0
+    for fg in utilities.fingers:
+        if fg in pos_dict:
+            len_barre = max(pos_dict[fg])-min(pos_dict[fg])+1
+            Rc += (int(fg) + 11) * (1 + len_barre/6.)
+    cost += int(Rc)
+
+    ### R27
+    for fg1 in fingers_used:
+        if len(pos_dict[str(fg1)]) > 1:
+            for fg2 in fingers_used:
+                if int(fg2) > int(fg1):
+                    if frets[pos_dict[str(fg1)][0]] == frets[pos_dict[str(fg2)][0]] and pos_dict[str(fg2)][0] < pos_dict[str(fg1)][0]-1:
+                        cost += 3200
+
+    ### R28 (strings without a finger yet will not hold the thumb)
+    if strummable:
+        Rc = 0
+        for fg in fingers_used:
+            if len(pos_dict[str(fg)]) > 1:
+                sensible_positions = [ix for ix in range(min(pos_dict[str(fg)]), max(pos_dict[str(fg)])+1) if ix not in pos_dict[str(fg)]]
+                for pos in sensible_positions:
+                    if finger_positions[pos] == 'x':
+                        if len([fg for fg in finger_positions if fg is None or (fg.lower() != 'x' and fg != '0' and fg != '5')]) <= 4:
+                            Rc = 3200
+                        else:
+                            Rc = 100
+        cost += Rc
+
+    return cost
+
+
+
 def rules_dict_to_str(rules_dict):
     """
     Return dictionary of rules as a string with costs associated in decreasing order.
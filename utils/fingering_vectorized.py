@@ -0,0 +1,414 @@
+# ===========================
+# Modules
+# ===========================
+import numpy as np
+##### Home-made modules #####
+from utils.model_functions import fret_model_func, muted_model_func
+from utils import utilities
+from utils.shapes import MUTED, OPEN, parse_frets
+
+
+# ===========================
+# Constants
+# ===========================
+# finger code of the thumb
+THUMB = 5
+
+FINGERS = [int(fg) for fg in utilities.fingers]
+ALL_FINGERS = [int(fg) for fg in utilities.all_fingers]
+# finger numbers as columns, to weight the rows of the per-finger statistics
+FINGERS_COL = np.array(FINGERS)[:, None]
+ALL_FINGERS_COL = np.array(ALL_FINGERS)[:, None]
+
+# pairs of fingers of rule R20, with the factors of their cost
+R20_COEF = 0.25
+R20_PAIRS = [(1, 2, [1, R20_COEF]), (2, 3, [1.5, R20_COEF]), (3, 4, [1.3, R20_COEF]),
+             (1, 3, [1, R20_COEF, 0.5]), (2, 4, [1, R20_COEF, 0.5]),
+             (1, 4, [1, R20_COEF, 0.25])]
+R20_FG1 = [fg1 for fg1, _, _ in R20_PAIRS]
+R20_FG2 = [fg2 for _, fg2, _ in R20_PAIRS]
+R20_GAP = np.array([fg2 - fg1 for fg1, fg2, _ in R20_PAIRS])[:, None]
+# factors as columns, 1 past the last one of a pair
+R20_FACTORS = [np.array([factors[i] if i < len(factors) else 1 for _, _, factors in R20_PAIRS])[:, None]
+               for i in range(3)]
+
+finger_span = np.array([utilities.finger_span[ft] for ft in range(len(utilities.finger_span))])
+finger_span_cost = np.array(utilities.finger_span_cost)
+
+
+# ===========================
+# Functions
+# ===========================
+def encode_frets(fret_positions):
+    """
+    Encode fret positions as integers (MUTED for a muted string).
+
+    Parameters
+    ----------
+    fret_positions : list
+        List of the fret positions (strings, integers or a shape of utils.shapes).
+
+    Returns
+    -------
+    frets : numpy.ndarray
+        Array of the 6 fret numbers.
+    """
+
+    return np.array(parse_frets(fret_positions))
+
+
+def decode_fingering(fingering):
+    """
+    Decode a row of the fingering array to the finger positions list used by compute_cost.
+
+    Parameters
+    ----------
+    fingering : numpy.ndarray
+        Array of the 6 finger numbers (-1 for a muted string, 0 for an open one).
+
+    Returns
+    -------
+    finger_positions : list
+        List of the finger positions.
+    """
+
+    return ['x' if fg == MUTED else str(fg) for fg in fingering]
+
+
+def candidate_fingerings(frets, thumb=False):
+    """
+    Build every fingering of a chord, in the order of itertools.product.
+
+    Parameters
+    ----------
+    frets : numpy.ndarray
+        Array of the 6 fret numbers.
+    thumb : bool
+        If True, build the fingerings with the thumb on string E (and
+        possibly on string A) instead of the ones using fingers 1-4 only.
+
+    Returns
+    -------
+    fingerings : numpy.ndarray
+        (N, 6) array of the finger numbers, open and muted strings keep
+        their fret code.
+    """
+
+    fingered_frets = np.flatnonzero(frets > 0)
+    if thumb:
+        if 0 not in fingered_frets:
+            return np.empty((0, 6), dtype=int)
+        choices = [[THUMB] if i == 0 else (ALL_FINGERS if i == 1 else FINGERS)
+                   for i in fingered_frets]
+    else:
+        choices = [FINGERS for _ in fingered_frets]
+    if not choices:
+        # nothing to finger, the only fingering is the chord itself
+        return np.where(frets > 0, 0, frets)[np.newaxis, :]
+    # same order as itertools.product(*choices)
+    products = np.array(np.meshgrid(*choices, indexing='ij')).reshape(len(choices), -1)
+    fingerings = np.tile(np.where(frets > 0, 0, frets), (products.shape[1], 1))
+    fingerings[:, fingered_frets] = products.T
+    return fingerings
+
+
+def compute_costs(fingerings, frets, return_rules_importance=False, strummable=True):
+    """
+    Compute the cost of many fingerings of the same chord at once.
+    Mirrors compute_cost, rule by rule, with array operations.
+
+    Parameters
+    ----------
+    fingerings : numpy.ndarray
+        (N, 6) array of the finger numbers (see candidate_fingerings).
+    frets : numpy.ndarray
+        Array of the 6 fret numbers.
+    return_rules_importance : bool
+        Return rules importance if True.
+    strummable : bool
+        Whether the chord is meant to be strummed (see rule R28).
+
+    Returns
+    -------
+    costs : numpy.ndarray
+        Cost of each fingering.
+    has_float_cost : numpy.ndarray
+        True where compute_cost would return a float rather than an int.
+  ( rules_dict : dictionary
+        Dictionary with rules as keys and arrays of costs as values. )
+    """
+
+    # strings along the first axis, so that reductions over strings are
+    # element-wise operations between 6 rows of N fingerings; string
+    # positions are int8 like the fingers, comparing them being most of
+    # the work on the shapes with few fingerings
+    F = np.ascontiguousarray(np.asarray(fingerings).T, dtype=np.int8)
+    T = np.asarray(frets)
+    N = F.shape[1]
+    fretted = T > 0
+    strings = np.arange(6, dtype=np.int8)[:, None]
+    T_col = T[:, None]
+    fretted_col = fretted[:, None]
+
+    ### Per-finger statistics, indexed by finger number (index 0 unused)
+    masks = F == np.arange(6, dtype=np.int8)[:, None, None]
+    has = masks.any(1)
+    count = masks.sum(1, dtype=np.int8).astype(int)
+    # strings held by each finger (6 and -1 for an unused finger), filled
+    # string by string rather than reduced over the strings of masks
+    min_pos = np.full((6, N), 6, dtype=np.int8)
+    max_pos = np.full((6, N), -1, dtype=np.int8)
+    for pos in range(6):
+        max_pos[masks[:, pos]] = pos
+        min_pos[masks[:, 5 - pos]] = 5 - pos
+    extent = np.where(has, max_pos - min_pos + 1, 0).astype(int)
+    # fret of the lowest-pitched string held by each finger
+    first_fret = T[np.minimum(min_pos, 5)]
+    n_fingers_used = has[1:].sum(0)
+    barres = count > 1
+
+    ### fret numbers used, without open strings and thumb
+    used_frets = fretted_col & (F != THUMB)
+    any_fret = used_frets.any(0)
+    fret_first = np.where(any_fret, np.where(used_frets, T_col, 100).min(0), 0)
+    fret_last = np.where(any_fret, np.where(used_frets, T_col, -100).max(0), 0)
+
+    # rules are only computed when compute_cost would compute them
+    active = set(utilities.rule_names)
+    rules = dict([(R, np.zeros(N)) for R in utilities.rule_names])
+    for R in ['R1bis', 'R2bis', 'R2ter', 'R4bis', 'R6bis']:
+        rules.setdefault(R, np.zeros(N))
+    has_float_cost = np.zeros(N, dtype=bool)
+
+    ### R1 and R1bis
+    if 'R1' in active:
+        barre = barres[FINGERS]
+        for pos_0 in np.flatnonzero(T == OPEN):
+            rules['R1'] += 100000 * (barre & (pos_0 < max_pos[FINGERS]) & (pos_0 > min_pos[FINGERS])).sum(0)
+            rules['R1bis'] += 10000 * (barre & (pos_0 > max_pos[FINGERS])).sum(0)
+
+    ### R2, R2bis and R2ter (over every pair of fretted strings a < b,
+    # where the lower finger number is the one of compute_cost's p1)
+    if 'R2' in active:
+        a, b = [p.ravel() for p in np.nonzero(fretted_col & fretted & (strings < strings.T))]
+        fg_a = F[a]
+        fg_b = F[b]
+        pair = (fg_a >= 1) & (fg_a <= 4) & (fg_b >= 1) & (fg_b <= 4) & (fg_a != fg_b)
+        # p1 is the string b
+        flipped = pair & (fg_b < fg_a)
+        rules['R2bis'] += 100 * flipped.sum(0)
+        higher_a = (T[a] > T[b])[:, None]
+        higher_b = (T[b] > T[a])[:, None]
+        rules['R2'] += 200000 * ((pair & ~flipped & higher_a) | (flipped & higher_b)).sum(0)
+        same_fret = T[a] == T[b]
+        if same_fret.any():
+            ext = extent[np.maximum(F, 0), np.arange(N)].astype(float)**4
+            ter = ext[a[same_fret]] * ext[b[same_fret]] * np.abs(fg_b - fg_a)[same_fret]
+            rules['R2ter'] += (ter * pair[same_fret]).sum(0)
+            rules['R2bis'] += 80 * flipped[same_fret].sum(0)
+
+    ### R3
+    if 'R3' in active:
+        span = fret_last - fret_first
+        over_span = span > finger_span[fret_first]
+        rules['R3'] += np.where(any_fret, np.where(over_span, 100000, finger_span_cost[np.minimum(span, len(finger_span_cost) - 1)]), 0)
+
+    ### R4 and R4bis
+    if 'R4' in active:
+        ext = extent[FINGERS]
+        rules['R4'] += (has[FINGERS] * (ext**2 + 1) * FINGERS_COL * 5).sum(0)
+        rules['R4bis'] += ((ext >= 3) * (FINGERS_COL - 1) * 20 * (ext - 3) * 20).sum(0)
+
+    ### R5
+    if 'R5' in active:
+        other_fret = (masks & (T_col != first_fret[:, None, :])).any(1)
+        rules['R5'] += 100000 * other_fret[ALL_FINGERS].sum(0)
+
+    ### R6 and R6bis (over every string)
+    if 'R6' in active:
+        # closest fingered string one to three strings under each string
+        # (-1 if none), a string being skipped by the barres under it
+        fingered_under = np.full((6, N), -1, dtype=np.int8)
+        for k in [3, 2, 1]:
+            fingered_under[k:] = np.where(F[:-k] > 0, strings[:-k], fingered_under[k:])
+        for fg in ALL_FINGERS:
+            if not barres[fg].any():
+                continue
+            candidates = barres[fg] & ~masks[fg] & fretted_col & (T_col <= first_fret[fg])
+            rules['R6'] += 100000 * (candidates & (strings > min_pos[fg]) & (strings < max_pos[fg])).sum(0)
+            above = (strings > max_pos[fg]) & (fingered_under <= max_pos[fg])
+            rules['R6bis'] += 500 * (candidates & above).sum(0)
+
+    ### R7
+    if 'R7' in active:
+        fingers = fretted_col & (F >= 1) & (F <= 4)
+        rules['R7'] += (fingers * ((T_col - fret_first) - (F - 1))**2).sum(0) * 150
+
+    ### R8
+    if 'R8' in active:
+        if fretted.sum() <= 4:
+            barre = np.zeros(N, dtype=bool)
+            for fg in [2, 3, 4]:
+                barre |= count[fg] > 1
+            rules['R8'] += 1000 * ((n_fingers_used < 4) & barre)
+
+    ### R9
+    if 'R9' in active:
+        no_thumb = F != THUMB
+        for fg in [2, 3]:
+            candidates = (count[fg] > 1) & ~masks[fg] & fretted_col
+            high = (strings < min_pos[fg] - 3) | ((strings < max_pos[fg] - 4) & no_thumb)
+            low = (strings < min_pos[fg] - 2) | ((strings < max_pos[fg] - 3) & no_thumb)
+            rules['R9'] += 10000 * (candidates & high).sum(0) + 2000 * (candidates & ~high & low).sum(0)
+
+    ### R10
+    if 'R10' in active:
+        rules['R10'] += 5000 * ((count[1] > 1) & (count[2] > 1))
+
+    ### R11
+    if 'R11' in active:
+        rules['R11'] += 10000 * (has[4] & masks[3] & fretted_col & (strings > min_pos[4] + 4)).sum(0)
+
+    ### R12
+    if 'R12' in active:
+        rules['R12'] += int(muted_model_func(tuple(T.tolist()))/10)
+
+    ### R13
+    if 'R13' in active:
+        span_3 = finger_span[fret_first] - 3
+        for fg1 in [1, 2, 3]:
+            fg2 = fg1 + 1
+            both = has[fg1] & has[fg2]
+            gap = first_fret[fg2] - first_fret[fg1]
+            rules['R13'] += both * (gap > span_3) * span_3**2 * 100 * np.abs(gap) * 2
+            if fg1 == 1:
+                rules['R13'] += both * (gap > 0) * (np.abs(gap) - 1) * 100
+
+    ### R14
+    if 'R14' in active:
+        rules['R14'] += 10000 * (has[3] & has[4] & (max_pos[3] - min_pos[3] > 1) & (min_pos[4] < max_pos[3]))
+
+    ### R15
+    if 'R15' in active:
+        pinky = has[4] & has[1] & (max_pos[1] - min_pos[1] == 5)
+        rules['R15'] += fret_last**2 + pinky * (6 - min_pos[4].astype(int))**4 * 0.5
+        has_float_cost |= pinky
+
+    ### R16
+    if 'R16' in active:
+        for fg in [2, 3]:
+            far = np.abs(first_fret[1] - first_fret[fg]) > 2
+            rules['R16'] += 4000 * (has[4] & has[1] & has[fg] & far & (min_pos[4] < max_pos[fg]))
+        far = np.abs(first_fret[2] - first_fret[3]) > 1
+        rules['R16'] += 4000 * (has[4] & has[2] & has[3] & far & (min_pos[4] < max_pos[3]))
+
+    ### R17 (fingerings only hold fingers 1-5)
+
+    ### R18
+    if 'R18' in active:
+        thumb_only_low = max_pos[THUMB] < 3
+        gap_under_thumb = masks[THUMB][2] & ~masks[THUMB][1]
+        rules['R18'] += has[THUMB] * np.where(thumb_only_low & masks[THUMB][0] & ~gap_under_thumb,
+                                              count[THUMB]**2 * 1000, 200000)
+
+    ### R19
+    if 'R19' in active:
+        if has[THUMB].any():
+            fg_max = np.where((F >= 1) & (F <= 4), F, 0).max(0)
+            fg_min = np.where(F >= 1, F, 6).min(0)
+            max_masks = F == fg_max
+            pos_min = np.minimum(np.where(F == fg_min, strings, 6).min(0), 5)
+            ft_min = T[pos_min]
+            several = n_fingers_used > 1
+            for pos5 in range(6):
+                thumb = masks[THUMB][pos5]
+                ft5 = T[pos5]
+                for pos4 in range(6):
+                    on = thumb & several & max_masks[pos4]
+                    ft4 = T[pos4]
+                    if ft5 > ft4 or ft5 < ft4 - 4:
+                        rules['R19'] += 100000 * on
+                    elif ft5 == ft4 or ft5 < ft4 - 3:
+                        rules['R19'] += 5000 * on
+                rules['R19'] += 100000 * (thumb & (ft5 < ft_min - 2))
+                rules['R19'] += thumb * (ft_min < ft5) * (ft5 - ft_min)**3 * 1000
+
+    ### R20
+    if 'R20' in active:
+        # the pairs of R20_PAIRS along the first axis
+        ft1 = first_fret[R20_FG1]
+        ft2 = first_fret[R20_FG2]
+        Rc = (40 - ft1) * np.abs(ft2 - ft1 - R20_GAP)
+        for factor in R20_FACTORS:
+            Rc = Rc * factor
+        rules['R20'] += ((has[R20_FG1] & has[R20_FG2]) * np.trunc(Rc)).sum(0)
+
+    ### R21
+    if 'R21' in active:
+        for i in range(2, 6):
+            if T[i] == T[i-1] and T[i-2] == T[i-1] and fretted[i]:
+                a, b, c = F[i-2], F[i-1], F[i]
+                distinct = (a != b) & (a != c) & (b != c)
+                ordered = np.sort(F[i-2:i+1], axis=0)
+                if T[i] <= 9:
+                    wrong = (b != ordered[0]) * 1 + (a != ordered[1]) + (c != ordered[2])
+                else:
+                    wrong = (c != ordered[0]) * 1 + (b != ordered[1]) + (a != ordered[2])
+                rules['R21'] += 100 * distinct * wrong
+
+    ### R22
+    if 'R22' in active:
+        rules['R22'] += (has[ALL_FINGERS] * 4 * ALL_FINGERS_COL).sum(0)
+
+    ### R23
+    if 'R23' in active:
+        Rc = np.zeros(N)
+        for fg in FINGERS:
+            Rc = Rc + np.where(has[fg], (fg + 11) * (1 + extent[fg]/6.), 0.)
+        rules['R23'] += np.trunc(Rc)
+
+    ### R24
+    if 'R24' in active:
+        expected = np.where(fretted, 1, T)[:, None]
+        rules['R24'] += 500000 * ((F != expected) & ((F <= 0) | ~fretted_col)).any(0)
+
+    ### R25
+    if 'R25' in active:
+        rules['R25'] += int(fret_model_func(tuple(T.tolist()))/10)
+
+    ### R26 (compute_cost checks string fingers against the integer set of
+    # fingers used, so only its base cost applies)
+    if 'R26' in active:
+        rules['R26'] += 100
+
+    ### R27
+    if 'R27' in active:
+        for fg1 in ALL_FINGERS[:-1]:
+            if not barres[fg1].any():
+                continue
+            # the fingers fg2 > fg1 along the first axis
+            fg2 = slice(fg1 + 1, ALL_FINGERS[-1] + 1)
+            rules['R27'] += 3200 * barres[fg1] * (has[fg2] & (first_fret[fg2] == first_fret[fg1])
+                                                  & (min_pos[fg2] < min_pos[fg1] - 1)).sum(0)
+
+    ### R28
+    if 'R28' in active:
+        if strummable:
+            over_mute = np.zeros(N, dtype=bool)
+            barre = barres[ALL_FINGERS]
+            for pos in np.flatnonzero(T == MUTED):
+                over_mute |= (barre & (min_pos[ALL_FINGERS] < pos) & (pos < max_pos[ALL_FINGERS])).any(0)
+            n_fingered = ((F >= 1) & (F != THUMB)).sum(0)
+            rules['R28'] += over_mute * np.where(n_fingered <= 4, 3200, 100)
+
+    ### R29, R30 and R31 have null costs
+
+    costs = np.zeros(N)
+    for R in rules:
+        costs += rules[R]
+
+    # Returns
+    if return_rules_importance:
+        return costs, has_float_cost, rules
+    else:
+        return costs, has_float_cost
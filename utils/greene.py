@@ -0,0 +1,123 @@
+# ===========================
+# Modules
+# ===========================
+import re
+##### Home-made modules #####
+from utils.shapes import MUTED
+from utils.utilities import greene_table
+
+
+# ===========================
+# Constants
+# ===========================
+# voices of a four-note chord, from the lowest to the highest
+VOICES = 'BTAS'
+
+# MIDI note number of each open string, from the low-pitched E string
+OPEN_STRING_PITCHES = (40, 45, 50, 55, 59, 64)
+
+# a voice letter of a pattern, with its octave displacement
+PATTERN_VOICE = re.compile(r'([BTAS])([+-]?)')
+OCTAVE_SHIFTS = {'': 0, '+': 12, '-': -12}
+
+
+# ===========================
+# Functions
+# ===========================
+def shape_pitches(frets):
+    """ Returns the MIDI note numbers of the played strings of a shape. """
+
+    return [OPEN_STRING_PITCHES[i] + ft for i, ft in enumerate(frets) if ft != MUTED]
+
+
+def voicing_steps(pitches):
+    """
+    Spacing of the voices of a chord in chord tones: for each pair of
+    adjacent voices, the number of chord tones (in any octave) above the
+    lower voice up to the upper one. It does not depend on the transposition,
+    the inversion nor the quality of the chord, only on its voicing.
+
+    Parameters
+    ----------
+    pitches : list
+        Pitches of the voices, in semitones.
+
+    Returns
+    -------
+    steps : tuple
+        Number of chord tones between each pair of adjacent voices.
+    """
+
+    pitches = sorted(pitches)
+    pitch_classes = set([p % 12 for p in pitches])
+    return tuple([sum(1 for p in range(low + 1, high + 1) if p % 12 in pitch_classes)
+                  for low, high in zip(pitches, pitches[1:])])
+
+
+def pattern_pitches(pattern):
+    """
+    Pitches of the voices of a Greene pattern, e.g. 'TAB-S'.
+
+    A pattern lists the voices in the order of the chord tones in close
+    position, each voice then being the first occurrence of its chord tone
+    above the voice below it, and '+' ('-') moving a voice an octave higher
+    (lower).
+
+    Returns
+    -------
+    pitches : list
+        Pitches of the voices B, T, A and S, in semitones.
+    """
+
+    tones = PATTERN_VOICE.findall(pattern)
+    if len(tones) != len(VOICES) or sorted(v for v, _ in tones) != sorted(VOICES):
+        raise ValueError("Invalid Greene pattern %r" % pattern)
+    tone_of = dict((v, i) for i, (v, _) in enumerate(tones))
+    shift_of = dict((v, OCTAVE_SHIFTS[shift]) for v, shift in tones)
+    pitches = []
+    for v in VOICES:
+        pitch = tone_of[v]
+        while pitches and pitch <= pitches[-1]:
+            pitch += 12
+        pitches.append(pitch)
+    return [pitch + shift_of[v] for pitch, v in zip(pitches, VOICES)]
+
+
+def build_greene_index(table):
+    """
+    Index the voicings of a Greene table by the spacing of their voices
+    (see `voicing_steps`), shared by all the inversions of a voicing.
+
+    Parameters
+    ----------
+    table : dict
+        Patterns of each voicing name (see utilities.greene_table).
+
+    Returns
+    -------
+    index : dict
+        Voicing name of each voices spacing.
+    """
+
+    index = {}
+    for name, patterns in table.items():
+        for pattern in patterns:
+            steps = voicing_steps(pattern_pitches(pattern))
+            if index.setdefault(steps, name) != name:
+                raise ValueError("Greene pattern %r of %s is also a voicing of %s"
+                                 % (pattern, name, index[steps]))
+    return index
+
+
+def greene_voicing(pitches):
+    """
+    Returns the Greene voicing name of a chord of four distinct notes given
+    the pitches of its voices, None for other chords or unlisted voicings.
+    """
+
+    if len(pitches) != len(VOICES) or len(set([p % 12 for p in pitches])) != len(VOICES):
+        return None
+    return greene_index.get(voicing_steps(pitches))
+
+
+greene_index = build_greene_index(greene_table)
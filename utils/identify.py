@@ -1,6 +1,9 @@
 import csv
 from collections import deque
 
+from utils.caching import LRUCache
+from utils.shapes import MUTED, parse_frets
+
 
 def get_column_with_key(filename, key):
     columnData = list()
@@ -12,11 +15,21 @@ def get_column_with_key(filename, key):
 
 
 def write_new_column(outputfile, data):
-    with open(outputfile, 'wb') as csvoutput:
+    with open(outputfile, 'w', newline='') as csvoutput:
         writer = csv.writer(csvoutput)
         writer.writerow(data)
 
 
+def remove_duplicates(values):
+    output = []
+    seen = set()
+    for value in values:
+        if value not in seen:
+            output.append(value)
+            seen.add(value)
+    return output
+
+
 def distanceBetween(noteA, noteB):
     counter = 0
     notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
@@ -46,6 +59,7 @@ class Identify:
         self.notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A',
                       'A#', 'B']
         self.tuning = ['E', 'A', 'D', 'G', 'B', 'E']
+        self.open_note_indexes = [self.notes.index(note) for note in self.tuning]
 
         self.fith_interval_profile = [(set([5]), 0, '5')]
         self.flat_fith_omit3_profile = [(set([6]), 0, '(b5, omit 3)')]
@@ -242,6 +256,85 @@ class Identify:
                                    self.minor_sixth_add_eleven_omit_five,
                                    self.sev_sharp_fith_profile]
 
+        # profiles matched by each set of intervals from a root, as 12-bit masks
+        self.note_indexes = dict((note, i) for i, note in enumerate(self.notes))
+        self.three_note_index = self.build_profile_index(
+            self.three_note_profiles, self.label_chord)
+        self.four_note_index = self.build_profile_index(
+            self.four_note_profiles, self.label_chord)
+        self.triad_index = self.build_profile_index(
+            self.profiles_to_check_with_out_bass,
+            self.label_chord_with_no_inverstion)
+        self.interval_index = self.build_profile_index(
+            self.two_note_profiles, self.label_chord_with_no_inverstion)
+        self.chord_names_cache = LRUCache(maxsize=65536)
+
+    def build_profile_index(self, profiles, label):
+        # index[mask] lists the (shift, name) of the profiles matched by the
+        # intervals of mask, in the order check_profiles finds them
+        index = [[] for _ in range(1 << len(self.notes))]
+        for mask in range(1, len(index), 2):
+            distances = ([i for i in range(len(self.notes)) if mask >> i & 1], None)
+            for profile in profiles:
+                shift = label(distances, profile)
+                if shift != -1:
+                    index[mask].append((shift, profile[0][2]))
+        return index
+
+    def interval_mask(self, pitch_mask, root):
+        size = len(self.notes)
+        return ((pitch_mask >> root) | (pitch_mask << (size - root))) & ((1 << size) - 1)
+
+    def names_from_index(self, index, pitch_classes):
+        # same roots order as the rotations of Chord.get_chord_distances
+        pitch_mask = 0
+        for pc in pitch_classes:
+            pitch_mask |= 1 << pc
+        chord_lists = list()
+        for root in pitch_classes[:1] + pitch_classes[:0:-1]:
+            chord_list = list()
+            for shift, name in index[self.interval_mask(pitch_mask, root)]:
+                chord = self.notes[(root + shift) % len(self.notes)] + name
+                if chord not in chord_list:
+                    chord_list.append(chord)
+            chord_lists.append(chord_list)
+        return chord_lists
+
+    def chord_names(self, played_notes):
+        return self.chord_names_for_pitch_classes(
+            [self.note_indexes[note] for note in played_notes])
+
+    def pitch_classes_for_frets(self, frets):
+        return [(self.open_note_indexes[string_number] + fret) % len(self.notes)
+                for string_number, fret in enumerate(frets) if fret != MUTED]
+
+    def chord_names_for_pitch_classes(self, pitch_classes):
+        cleaned = tuple(remove_duplicates(pitch_classes))
+        withoutbase = tuple(remove_duplicates(pitch_classes[1:]))
+        key = (cleaned, withoutbase)
+        chord_list = self.chord_names_cache.get(key)
+        if chord_list is None:
+            chord_list = self.identify_pitch_classes(cleaned, withoutbase)
+            self.chord_names_cache.put(key, chord_list)
+        return list(chord_list)
+
+    def identify_pitch_classes(self, cleaned, withoutbase):
+        bass = cleaned[0]
+        index = self.three_note_index if len(cleaned) <= 3 else self.four_note_index
+        chord_list = list()
+        for chords in self.names_from_index(index, cleaned):
+            chord_list = chord_list + chords
+        chord_list = remove_duplicates(chord_list)
+        chord_list = [chord if chord[:2 if chord[1] == '#' else 1] == self.notes[bass]
+                      else chord + '/' + self.notes[bass] for chord in chord_list]
+        if len(cleaned) == 4 and bass not in withoutbase:
+            for chords in self.names_from_index(self.triad_index, withoutbase):
+                chord_list = chord_list + chords
+        elif len(cleaned) == 3 and bass not in withoutbase:
+            chord_list = chord_list + self.names_from_index(
+                self.interval_index, withoutbase)[1]
+        return chord_list
+
     def identify_chord(self, distances, cleaned_notes):
         profiles = list()
         if len(cleaned_notes) <= 3:
@@ -299,19 +392,10 @@ class Identify:
         return self.noteForStrings(frets.split("-"))
 
     def noteForStrings(self, fret_data):
-        played_notes = list()
-        for string_number in range(0, len(fret_data)):
-            fret = fret_data[string_number]
-            #if fret not in ['x', '0', 0]:
-            if fret != 'x':
-                open_note_index = self.notes.index(self.tuning[string_number])
-                note_index = open_note_index + int(fret)
-                if note_index < len(self.notes):
-                    played_notes.append(self.notes[note_index])
-                else:
-                    played_notes.append(
-                        self.notes[note_index - len(self.notes)])
-        return played_notes
+        return self.notes_for_frets(parse_frets(fret_data))
+
+    def notes_for_frets(self, frets):
+        return [self.notes[pc] for pc in self.pitch_classes_for_frets(frets)]
 
     def get_root_note(self, note, shift):
         note_index = self.notes.index(note) + shift
@@ -427,22 +511,6 @@ class Controller:
 
 
 def identify(played_notes, idf):
-    chord = Chord(played_notes)
-    chord_list = list()
-    for distance in chord.distances:
-        chord_list = chord_list + idf.identify_chord(distance,
-                                                     chord.cleaned_notes)
-    chord.chord_list = chord.remove_duplicates(chord_list)
-    chord.chord_list = chord.add_bass_to_list()
-    if (len(chord.cleaned_notes) == 4 and
-                chord.chord_low_note not in chord.notes_withoutbase):
-        for distance in chord.distances_withoutbase:
-            chord.chord_list = chord.chord_list + idf.identify_chord_triad(
-                distance, chord.notes_withoutbase)
-    elif len(chord.cleaned_notes) == 3 and \
-                    chord.chord_low_note not in chord.notes_withoutbase:
-        chord.chord_list = chord.chord_list + idf.identify_chord_interval(
-            chord.distances_withoutbase[1], chord.notes_withoutbase)
-    return chord.chord_list
+    return idf.chord_names(played_notes)
 
 idntf = Identify()
\ No newline at end of file
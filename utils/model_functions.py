@@ -2,25 +2,27 @@
 # Modules
 # ===========================
 import numpy as np
+##### Home-made modules #####
+from utils.shapes import MUTED
 
 
 # ===========================
 # Functions
 # ===========================
-def fret_model_func(fret_positions):
+def fret_model_func(frets):
     """
     Compute the cost according to the fret model function fitted with Eureqa.
 
     Parameters
     ----------
-    fret positions
+    frets (fret numbers, MUTED for muted strings, see utils.shapes)
 
     Returns
     -------
     fret model cost
     """
 
-    fret_positions = [int(ft) if ft.lower() != 'x' and ft != '0' else -1 for ft in fret_positions]
+    fret_positions = [ft if ft > 0 else -1 for ft in frets]
     if -1 in fret_positions and len(set(fret_positions)) == 1:
         pass
     else:
@@ -39,13 +41,13 @@ def fret_model_func(fret_positions):
     #return min([(cost_model_1 + cost_model_4 + cost_model_6) / 3., 16000.])
 
 
-def muted_model_func(fret_positions):
+def muted_model_func(frets):
     """
     Compute the cost according to the fret model function for muted strings fitted with Eureqa.
 
     Parameters
     ----------
-    fret positions
+    frets (fret numbers, MUTED for muted strings, see utils.shapes)
 
     Returns
     -------
@@ -57,16 +59,16 @@ def muted_model_func(fret_positions):
 
     # Model 3
     # This model is based on the sum of how many frets are larger than zero, how many frets are zero and how many are muted.
-    sx = fret_positions.count('x') + fret_positions.count('X')
-    s0 = fret_positions.count('0')
-    s1 = len(fret_positions) - sx - s0
+    sx = frets.count(MUTED)
+    s0 = frets.count(0)
+    s1 = len(frets) - sx - s0
 
     # Model 3:
     cost_model_muted_3 = 482.531383355394 * s1 + s1 * s0 ** s1 + (11062.8091995312 - np.exp(s1) - 2.57328901853245 ** (s1 * s0 ** s1)) / (6.7925016865907 + 38.5756725842058 * s1 ** (63.1562092766299 - sx * s1 ** 3)) - 599.343247028422
 
     # Mute pattern model
     # This model is based on the muted string pattern for each of the six strings. It has 6 input parameters.
-    fret_positions = [-2 if ft.lower() == 'x' else (-1 if int(ft) == 0 else 1) for ft in fret_positions]
+    fret_positions = [-2 if ft == MUTED else (-1 if ft == 0 else 1) for ft in frets]
     ME, MA, MD, MG, MB, MF = fret_positions
     DQ, DR, DS, DT, DU, DV = ME, MA, MD, MG, MB, MF
 
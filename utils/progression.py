@@ -0,0 +1,157 @@
+# ===========================
+# Modules
+# ===========================
+##### Home-made modules #####
+from utils.caching import LRUCache
+from utils.fingering_rules import predict_fingerings
+from utils.shapes import parse_frets
+
+
+# ===========================
+# Constants
+# ===========================
+# fingerings of each shape among which the progression is chosen
+DEFAULT_ALTERNATIVES = 5
+
+# transition costs: moving a finger by one fret or by one string (for each
+# end of a barre), and lifting a finger or putting it down
+FINGER_FRET_COST = 100
+FINGER_STRING_COST = 50
+FINGER_LIFT_COST = 50
+
+
+# ===========================
+# Functions
+# ===========================
+def fingering_progression(shapes, k=DEFAULT_ALTERNATIVES, strummable=True, transition_weight=1,
+                          predict=predict_fingerings, return_costs=False):
+    """
+    Finger a chord progression: choose among the k best fingerings of each
+    shape the sequence of least total cost, that is the costs of the
+    fingerings plus the weighted costs of the transitions between
+    consecutive chords (see `transition_cost`), with the Viterbi algorithm.
+
+    The fingerings of each distinct shape are predicted once (and kept in
+    `alternatives_cache`), and the transitions between two distinct shapes
+    are costed once, so a progression of n chords costs at most n k^2
+    transitions.
+
+    Parameters
+    ----------
+    shapes : list
+        Fret positions of each chord, in playing order.
+    k : int
+        Number of fingerings considered for each shape.
+    strummable : bool
+        Whether the chords are meant to be strummed (see rule R28).
+    transition_weight : float
+        Weight of the transition costs against the fingering costs.
+    predict : function
+        Function predicting the k best fingerings of a shape (see
+        fingering_rules.predict_fingerings).
+    return_costs : bool
+        Return the costs of the fingerings and of the transitions if True.
+
+    Returns
+    -------
+    fingerings : list
+        Fingering of each chord.
+    total_cost : float
+        Total cost of the progression.
+  ( costs : list
+        Cost of the fingering of each chord.
+    transition_costs : list
+        Weighted cost of the transition to each chord from the previous
+        one, 0 for the first chord. )
+    """
+
+    frets = [parse_frets(fret_positions) for fret_positions in shapes]
+    if not frets:
+        return ([], 0, [], []) if return_costs else ([], 0)
+    candidates = {}
+    for shape in frets:
+        if shape not in candidates:
+            candidates[shape] = _candidates(shape, k, strummable, predict)
+
+    ### cheapest progression ending with each fingering of each chord
+    transitions = {}
+    scores = [cost for _, cost, _ in candidates[frets[0]]]
+    pointers = []
+    for previous, shape in zip(frets, frets[1:]):
+        matrix = transitions.get((previous, shape))
+        if matrix is None:
+            matrix = [[transition_weight * transition_cost(places1, places2)
+                       for _, _, places2 in candidates[shape]]
+                      for _, _, places1 in candidates[previous]]
+            transitions[(previous, shape)] = matrix
+        new_scores = []
+        back = []
+        for j, (_, cost, _) in enumerate(candidates[shape]):
+            i = min(range(len(scores)), key=lambda i: scores[i] + matrix[i][j])
+            back.append(i)
+            new_scores.append(scores[i] + matrix[i][j] + cost)
+        scores = new_scores
+        pointers.append(back)
+
+    ### walk the cheapest progression back
+    j = min(range(len(scores)), key=scores.__getitem__)
+    total_cost = scores[j]
+    path = [j]
+    for back in reversed(pointers):
+        j = back[j]
+        path.append(j)
+    path.reverse()
+
+    fingerings = [list(candidates[shape][j][0]) for shape, j in zip(frets, path)]
+    if not return_costs:
+        return fingerings, total_cost
+    costs = [candidates[shape][j][1] for shape, j in zip(frets, path)]
+    transition_costs = [0] + [transitions[(previous, shape)][i][j] for previous, shape, i, j
+                              in zip(frets, frets[1:], path, path[1:])]
+    return fingerings, total_cost, costs, transition_costs
+
+
+def _candidates(shape, k, strummable, predict):
+    key = (shape, k, strummable)
+    candidates = alternatives_cache.get(key)
+    if candidates is None:
+        candidates = [(fingering, cost, finger_places(shape, fingering))
+                      for fingering, cost in predict(shape, k, strummable)]
+        alternatives_cache.put(key, candidates)
+    return candidates
+
+
+def finger_places(frets, fingering):
+    """
+    Returns where each finger of a fingering is: its fret, and its lowest
+    and highest strings (the same unless it makes a barre).
+    """
+
+    strings = {}
+    for i, ft in enumerate(frets):
+        if ft > 0:
+            strings.setdefault(fingering[i], []).append(i)
+    return dict((fg, (frets[s[0]], min(s), max(s))) for fg, s in strings.items())
+
+
+def transition_cost(places1, places2):
+    """
+    Cost of the hand movement from a fingering to the next one, given the
+    places of their fingers (see `finger_places`): the distance covered by
+    each finger kept on the fretboard, and the fingers lifted or put down.
+    A finger staying where it is (a guide finger) costs nothing.
+    """
+
+    cost = 0
+    for fg in set(places1) | set(places2):
+        if fg in places1 and fg in places2:
+            (ft1, low1, high1), (ft2, low2, high2) = places1[fg], places2[fg]
+            cost += (FINGER_FRET_COST * abs(ft2 - ft1)
+                     + FINGER_STRING_COST * (abs(low2 - low1) + abs(high2 - high1)))
+        else:
+            cost += FINGER_LIFT_COST
+    return cost
+
+
+# best fingerings of the shapes fingered lately, with the places of their fingers
+alternatives_cache = LRUCache(maxsize=4096)
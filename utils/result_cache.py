@@ -0,0 +1,195 @@
+# ===========================
+# Modules
+# ===========================
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+##### Home-made modules #####
+from utils.shapes import parse_frets, pack_frets
+
+
+# ===========================
+# Constants
+# ===========================
+# modules whose changes alter the results (rules weights, chord profiles...)
+VERSIONED_MODULES = ['fingering_rules.py', 'fingering_vectorized.py', 'identify.py',
+                     'model_functions.py', 'utilities.py']
+
+
+# ===========================
+# Classes
+# ===========================
+class ResultCache:
+    """
+    Results of shapes kept in an SQLite database, shared by the processes
+    of a host and across restarts.
+
+    The least recently used results are evicted when the database holds
+    more than maxsize of them, and every result is dropped when the
+    version of the logic code (see `results_version`) changes.
+
+    Lookups only write to the database now and then, so that the processes
+    reading it do not queue on its write lock: the last use of a result is
+    refreshed when older than touch_after seconds, and the hits and misses
+    of a process are added to the shared counters every flush_every lookups.
+    """
+
+    # puts of a process between two evictions
+    evict_every = 100
+    # lookups of a process between two updates of the shared counters
+    flush_every = 100
+    # age of the last use of a result refreshed by a lookup, in seconds
+    touch_after = 3600
+
+    def __init__(self, filename, maxsize=100000, version=None):
+        self.filename = filename
+        self.maxsize = maxsize
+        self.version = version or results_version()
+        self._local = threading.local()
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS results "
+                         "(shape INTEGER PRIMARY KEY, value TEXT, last_used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)")
+            row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if row is None or row[0] != self.version:
+                conn.execute("DELETE FROM results")
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (self.version,))
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('hits', 0)")
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('misses', 0)")
+
+    def _connection(self):
+        # one connection per thread, opened again in forked workers
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, fret_positions):
+        """
+        Returns the result stored for a shape, or None (also for the shapes
+        which cannot be packed, see utils.shapes).
+        """
+
+        try:
+            shape = pack_frets(parse_frets(fret_positions))
+            conn = self._connection()
+            row = conn.execute("SELECT value, last_used FROM results WHERE shape = ?",
+                               (shape,)).fetchone()
+            now = time.time()
+            if row is not None and now - row[1] > self.touch_after:
+                with conn:
+                    conn.execute("UPDATE results SET last_used = ? WHERE shape = ?", (now, shape))
+        except (ValueError, sqlite3.Error):
+            row = None
+        self._count(row is not None)
+        return json.loads(row[0]) if row is not None else None
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+            if self._hits + self._misses < self.flush_every:
+                return
+        self.flush()
+
+    def flush(self):
+        """ Adds the hits and misses counted by this process to the shared counters. """
+
+        with self._lock:
+            hits, misses = self._hits, self._misses
+            self._hits = self._misses = 0
+        if not hits and not misses:
+            return
+        try:
+            with self._connection() as conn:
+                conn.execute("UPDATE meta SET value = value + CASE name WHEN 'hits' THEN ? "
+                             "ELSE ? END WHERE name IN ('hits', 'misses')", (hits, misses))
+        except sqlite3.Error:
+            pass
+
+    def put(self, fret_positions, value):
+        """
+        Stores the result (JSON serializable) of a shape, unless the shape
+        cannot be packed (see utils.shapes).
+        """
+
+        try:
+            shape = pack_frets(parse_frets(fret_positions))
+            with self._connection() as conn:
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                             (shape, json.dumps(value), time.time()))
+                self._puts += 1
+                if self._puts % self.evict_every == 0:
+                    conn.execute("DELETE FROM results WHERE shape IN "
+                                 "(SELECT shape FROM results ORDER BY last_used DESC "
+                                 "LIMIT -1 OFFSET ?)", (self.maxsize,))
+        except (ValueError, sqlite3.Error):
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._hits = self._misses = 0
+        with self._connection() as conn:
+            conn.execute("DELETE FROM results")
+            conn.execute("UPDATE meta SET value = 0 WHERE name IN ('hits', 'misses')")
+
+    def info(self):
+        """
+        Returns the counters of the cache (all processes, up to their last
+        flush, this one included) as a dictionary.
+        """
+        self.flush()
+        conn = self._connection()
+        counters = dict(conn.execute("SELECT name, value FROM meta WHERE name IN ('hits', 'misses')"))
+        lookups = counters['hits'] + counters['misses']
+        return {'hits': counters['hits'],
+                'misses': counters['misses'],
+                'hit_rate': counters['hits'] / lookups if lookups else 0.,
+                'size': len(self),
+                'maxsize': self.maxsize,
+                'version': self.version}
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+# ===========================
+# Functions
+# ===========================
+def results_version():
+    """ Hash of the logic code, which changes whenever the results may change. """
+
+    digest = hashlib.sha1()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in VERSIONED_MODULES:
+        with open(os.path.join(directory, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_result_cache(filename, maxsize=100000):
+    """ Returns the result cache stored in filename, or None if it cannot be opened. """
+
+    if not filename:
+        return None
+    try:
+        cache = ResultCache(filename, maxsize)
+    except sqlite3.Error:
+        return None
+    atexit.register(cache.flush)
+    return cache
@@ -0,0 +1,98 @@
+# ===========================
+# Constants
+# ===========================
+N_STRINGS = 6
+
+# fret number of a muted string
+MUTED = -1
+OPEN = 0
+
+# packed shapes use 5 bits per string, the low-pitched E string in the lowest bits
+FRET_BITS = 5
+FRET_MASK = (1 << FRET_BITS) - 1
+PACKED_MUTED = FRET_MASK
+MAX_FRET = FRET_MASK - 1
+
+
+# ===========================
+# Functions
+# ===========================
+def parse_frets(fret_positions):
+    """
+    Convert fret positions to the integer shape used by the logic code.
+
+    Parameters
+    ----------
+    fret_positions : list
+        List of the fret positions on the strings, as strings or integers,
+        'x' (or 'X') for a muted string. A shape is returned unchanged.
+
+    Returns
+    -------
+    frets : tuple
+        Tuple of the fret numbers, MUTED for the muted strings.
+    """
+
+    return tuple([MUTED if ft == 'x' or ft == 'X' else int(ft) for ft in fret_positions])
+
+
+def format_frets(frets):
+    """
+    Convert a shape back to the fret positions strings of the API.
+
+    Parameters
+    ----------
+    frets : tuple
+        Tuple of the fret numbers, MUTED for the muted strings.
+
+    Returns
+    -------
+    fret_positions : list
+        List of the fret positions, 'x' for a muted string.
+    """
+
+    return ['x' if ft == MUTED else str(ft) for ft in frets]
+
+
+def pack_frets(frets):
+    """
+    Pack a shape into a single 30-bit integer.
+
+    Parameters
+    ----------
+    frets : tuple
+        Tuple of the 6 fret numbers, MUTED for the muted strings.
+
+    Returns
+    -------
+    code : int
+        Packed shape, FRET_BITS bits per string.
+    """
+
+    code = 0
+    for i, ft in enumerate(frets):
+        if ft == MUTED:
+            ft = PACKED_MUTED
+        elif not 0 <= ft <= MAX_FRET:
+            raise ValueError("Fret %r out of range, expected 0-%d or muted" % (ft, MAX_FRET))
+        code |= ft << (FRET_BITS * i)
+    return code
+
+
+def unpack_frets(code):
+    """
+    Unpack a shape packed by `pack_frets`.
+
+    Parameters
+    ----------
+    code : int
+        Packed shape.
+
+    Returns
+    -------
+    frets : tuple
+        Tuple of the 6 fret numbers, MUTED for the muted strings.
+    """
+
+    frets = [(code >> (FRET_BITS * i)) & FRET_MASK for i in range(N_STRINGS)]
+    return tuple([MUTED if ft == PACKED_MUTED else ft for ft in frets])
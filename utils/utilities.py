@@ -39,6 +39,12 @@ semitones_offsets = [7,0,5,10,2,7]
 # define cost threshold
 cost_threshold = 10000
 
+# rules making a fingering unplayable: each break costs at least hard_rule_cost,
+# so the fingerings breaking none of them are the only candidates as soon as
+# one of these costs less than hard_rule_cost
+hard_rules = ['R1', 'R2', 'R5', 'R6']
+hard_rule_cost = 100000
+
 # string names
 string_names = ['E', 'A', 'D', 'G', 'B', 'e']
 
@@ -102,6 +108,7 @@ ordered_useless_intervals = ['1','8',
                              '3','10','b3','b10']
 
 # Changing this list order changes the rule computation order
+# (unless reordered by fingering_rules.reorder_rules, which never changes the costs)
 rule_names = ['R1',
               'R1bis',
               'R2',
@@ -0,0 +1,96 @@
+# ===========================
+# Modules
+# ===========================
+import numpy as np
+##### Home-made modules #####
+from utils.answer_table import unpack_answer
+from utils.shapes import N_STRINGS, FRET_BITS, FRET_MASK, PACKED_MUTED, MAX_FRET, unpack_frets
+
+
+# ===========================
+# Classes
+# ===========================
+class VoicingIndex:
+    """
+    Inverted index of an answer table, from each chord name to the shapes
+    it names, ranked by the cost of their fingering.
+
+    The shapes of all the chord names are stored in a single array of table
+    rows, grouped by chord name and sorted by cost (then by packed shape)
+    within each group, so a query only scans the head of one group.
+    """
+
+    # rows checked at once against the fret window
+    chunk_size = 1024
+
+    def __init__(self, table):
+        self.table = table
+        keys = np.asarray(table.keys, dtype=np.int64)
+
+        ### lowest and highest fretted fret of each shape (MAX_FRET + 1 and 0
+        ### if none, so that the shapes without fretted string fit every window)
+        frets = np.array([(keys >> (FRET_BITS * i)) & FRET_MASK for i in range(N_STRINGS)])
+        fretted = (frets > 0) & (frets != PACKED_MUTED)
+        self.fret_lows = np.where(fretted, frets, MAX_FRET + 1).min(0).astype(np.int8)
+        self.fret_highs = np.where(fretted, frets, 0).max(0).astype(np.int8)
+
+        ### rows of each chord names list, sorted by cost then by shape
+        name_ids = np.asarray(table.name_ids)
+        order = np.lexsort((keys, np.asarray(table.costs), name_ids))
+        bounds = np.searchsorted(name_ids[order], np.arange(len(table.offsets)))
+
+        ### gather the lists of each chord name
+        lists = {}
+        for name_id in range(len(table.offsets) - 1):
+            for chord_name in table.chord_names(name_id):
+                lists.setdefault(chord_name, []).append(name_id)
+        groups = []
+        self.groups = {}
+        start = 0
+        for chord_name in sorted(lists):
+            rows = np.concatenate([order[bounds[i]:bounds[i+1]] for i in lists[chord_name]])
+            if len(lists[chord_name]) > 1:
+                rows = rows[np.lexsort((keys[rows], table.costs[rows]))]
+            groups.append(rows.astype(np.uint32))
+            self.groups[chord_name] = (start, start + len(rows))
+            start += len(rows)
+        self.rows = np.concatenate(groups) if groups else np.empty(0, dtype=np.uint32)
+
+    def find(self, chord_name, k=10, fret_min=0, fret_max=MAX_FRET):
+        """
+        Find the easiest voicings of a chord within a fret window.
+
+        Parameters
+        ----------
+        chord_name : str
+            Chord name, as returned by `identify`.
+        k : int
+            Maximum number of voicings to return.
+        fret_min, fret_max : int
+            Window where all the fretted strings must be (open and muted
+            strings are always allowed).
+
+        Returns
+        -------
+        voicings : list
+            Up to k (frets, fingering, cost) tuples, by increasing cost.
+        """
+
+        start, end = self.groups.get(chord_name, (0, 0))
+        found = []
+        while start < end and len(found) < k:
+            rows = self.rows[start:min(start + self.chunk_size, end)]
+            inside = (self.fret_lows[rows] >= fret_min) & (self.fret_highs[rows] <= fret_max)
+            found.extend(rows[inside][:k - len(found)].tolist())
+            start += self.chunk_size
+        voicings = []
+        for row in found:
+            fingering, cost = unpack_answer(int(self.table.fingerings[row]), self.table.costs[row])
+            voicings.append((unpack_frets(int(self.table.keys[row])), fingering, cost))
+        return voicings
+
+    def __contains__(self, chord_name):
+        return chord_name in self.groups
+
+    def __len__(self):
+        return len(self.groups)